@@ -0,0 +1,270 @@
+#! /usr/bin/python3
+# binary captures of live midi and replay of them into the engines
+#   python3 capture.py info FILE
+#   python3 capture.py replay FILE --engine proxy|sustainer|repeater [--fast] [--speed X]
+import os
+import sys
+import mmap
+import time
+import struct
+import argparse
+import threading
+import importlib.util
+import mido
+
+MAGIC = b'PIMUCAP1'
+
+# source id, monotonic timestamp, length, then length raw midi bytes. a record
+# with the NAME bit set on its id carries the utf-8 name of that source instead
+RECORD = struct.Struct('<HdH')
+NAME = 0x8000
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+class Capture:
+    '''
+    appends every message handed to it to a capture file, safe to feed from
+    the callbacks of several ports at once
+    '''
+    def __init__(self, path, buffering=1<<16):
+        self.file = open(path, 'ab', buffering=buffering)
+        self.lock = threading.Lock()
+        self.sources = {}
+
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+
+    def source(self, name):
+        source_id = self.sources.get(name)
+
+        if source_id is None:
+            source_id = len(self.sources)
+            encoded = name.encode('utf-8')
+            with self.lock:
+                self.file.write(RECORD.pack(source_id | NAME, time.monotonic(), len(encoded)) + encoded)
+            self.sources[name] = source_id
+
+        return source_id
+
+    def write(self, source_id, timestamp, data):
+        record = RECORD.pack(source_id, timestamp, len(data)) + bytes(data)
+        with self.lock:
+            self.file.write(record)
+
+    def callback(self, name, nxt=None):
+        # records each message from the named source before passing it on
+        source_id = self.source(name)
+        write = self.write
+        monotonic = time.monotonic
+
+        if nxt is None:
+            return lambda msg: write(source_id, monotonic(), msg.bytes())
+
+        def received(msg):
+            write(source_id, monotonic(), msg.bytes())
+            nxt(msg)
+        return received
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def records(path):
+    '''
+    yields (source name, timestamp, raw bytes) from a capture, read through an
+    mmap so long captures are not loaded up front
+    '''
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= len(MAGIC):
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if buf[:len(MAGIC)] != MAGIC:
+                raise ValueError("%s is not a midi capture" % (path))
+
+            names = {}
+            unpack = RECORD.unpack_from
+            size = RECORD.size
+            pos = len(MAGIC)
+            end = len(buf)
+
+            while pos + size <= end:
+                source_id, timestamp, length = unpack(buf, pos)
+                pos += size
+                data = buf[pos:pos + length]
+                pos += length
+
+                if source_id & NAME:
+                    names[source_id & ~NAME] = data.decode('utf-8')
+                else:
+                    yield names.get(source_id, str(source_id)), timestamp, data
+
+def replay(path, deliver, advance=None, realtime=True, speed=1.0):
+    '''
+    streams a capture into deliver(source, message). advance(t), if given, is
+    called with the time since the start of the capture before each message,
+    which lets engines on a virtual clock catch up to it. in real time the
+    original spacing of the messages is kept, scaled by speed, otherwise they
+    go as fast as the engine takes them. returns the number of messages
+    '''
+    start = None
+    began = time.monotonic()
+    count = 0
+    parse = mido.Message.from_bytes
+
+    for source, timestamp, data in records(path):
+        if start is None: start = timestamp
+        t = timestamp - start
+
+        if realtime:
+            wait = began + t/speed - time.monotonic()
+            if wait > 0: time.sleep(wait)
+
+        if advance is not None:
+            advance(t)
+
+        try:
+            message = parse(data)
+        except ValueError:
+            continue
+
+        deliver(source, message)
+        count += 1
+
+    return count
+
+def load_script(name):
+    # the top level tools are scripts with dashes in their names
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), os.path.join(ROOT, name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class NullRtMidi:
+    def __init__(self):
+        self.sent = 0
+
+    def send_message(self, data):
+        self.sent += 1
+
+class NullPort:
+    '''
+    output with an rtmidi handle so the engines take their raw byte paths
+    '''
+    def __init__(self):
+        self._rt = NullRtMidi()
+
+    def send(self, message):
+        self._rt.send_message(message.bytes())
+
+    def reset(self):
+        pass
+
+    def panic(self):
+        pass
+
+def proxy_engine(port):
+    proxy = load_script('midi-proxy')
+    chain = proxy.build_chain([proxy.drop('clock')], [port])
+    return lambda source, message: chain(message), None, lambda: None
+
+def sustainer_engine(port):
+    sustainer = load_script('midi-sustainer').Sustainer(port, 64)
+
+    def done():
+        # a fast replay outruns the writer thread, which then gets batches
+        # joined together
+        while sustainer.raw.depth: time.sleep(0.001)
+        if sustainer.raw.coalesced:
+            print("sustainer coalesced %d batches" % (sustainer.raw.coalesced))
+
+    return lambda source, message: sustainer.send(message), None, done
+
+def repeater_engine(port, realtime):
+    # the repeater modules import each other by their bare names
+    sys.path.insert(0, os.path.join(ROOT, 'repeater'))
+    import tape
+    import repeater
+    import scheduler
+
+    sched = scheduler.Scheduler()
+    if not realtime:
+        clock = [time.time()]
+        tape.now = lambda: clock[0]
+        sched.advance(clock[0])
+    monolith = repeater.Repeater(port, sched)
+    monolith.loopOn()
+    last = [0.0]
+
+    def step(dt):
+        if realtime:
+            sched.advance(time.time())
+        else:
+            clock[0] += dt
+            sched.advance(clock[0])
+        monolith.update(dt)
+
+    def advance(t):
+        # run every tape event that comes due before the next message, as
+        # the engine loop would by sleeping until it
+        while True:
+            due = sched.next_due()
+            if due is None or due - sched.stamp >= t - last[0]: break
+            dt = max(due - sched.stamp, 1e-5)
+            step(dt)
+            last[0] += dt
+        step(max(t - last[0], 0.0))
+        last[0] = max(t, last[0])
+
+    def deliver(source, message):
+        kind = message.type
+        if kind == 'note_on':
+            monolith.noteOn(message)
+        elif kind == 'note_off':
+            monolith.noteOff(message)
+        elif kind == 'control_change' and message.control == 64:
+            monolith.sustainOn() if message.value == 127 else monolith.sustainOff()
+
+    return deliver, advance, lambda: None
+
+def info(path):
+    counts = {}
+    first = last = None
+    for source, timestamp, data in records(path):
+        if first is None: first = timestamp
+        last = timestamp
+        counts[source] = counts.get(source, 0) + 1
+
+    print("%d messages over %.1fs" % (sum(counts.values()), (last - first) if first is not None else 0))
+    for source, count in sorted(counts.items()):
+        print("  %-30s %8d" % (source, count))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="inspect or replay midi captures")
+    parser.add_argument('action', choices=('info', 'replay'))
+    parser.add_argument('path')
+    parser.add_argument('--engine', choices=('proxy', 'sustainer', 'repeater'), default='proxy')
+    parser.add_argument('--fast', action='store_true', help="replay as fast as possible on a virtual clock")
+    parser.add_argument('--speed', type=float, default=1.0, help="real time replay speed")
+    args = parser.parse_args()
+
+    if args.action == 'info':
+        info(args.path)
+        sys.exit(0)
+
+    port = NullPort()
+    if args.engine == 'repeater':
+        deliver, advance, done = repeater_engine(port, not args.fast)
+    elif args.engine == 'sustainer':
+        deliver, advance, done = sustainer_engine(port)
+    else:
+        deliver, advance, done = proxy_engine(port)
+
+    start = time.perf_counter()
+    cpu = time.process_time()
+    count = replay(args.path, deliver, advance, realtime=not args.fast, speed=args.speed)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    done()
+
+    print("%d messages in %.3fs (%.0f msg/s), %.3fs cpu, %d written" % (count, elapsed, count/max(elapsed, 1e-9), cpu, port._rt.sent))
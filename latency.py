@@ -0,0 +1,76 @@
+import sys
+import time
+import signal
+import threading
+from bisect import bisect_left
+
+# upper edges of the histogram buckets in seconds, the last catches the rest
+BUCKETS = (0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.016, 0.033, 0.1, float('inf'))
+
+def bucket_label(edge):
+    if edge == float('inf'): return 'inf'
+    return '%gms' % (edge*1000)
+
+class LatencyHistograms:
+    '''
+    fixed bucket latency histograms keyed by (path, source, message type),
+    cheap enough to leave running in the midi hot paths. dumps to stderr every
+    interval seconds, if one is given, from a thread of its own, and on
+    dump_signal. recording never dumps, so the paths it times never write
+    '''
+    def __init__(self, interval=None, dump_signal=signal.SIGUSR1, out=sys.stderr):
+        self.hists = {}
+        self.interval = interval
+        self.out = out
+        self.overruns = 0
+
+        if dump_signal is not None:
+            signal.signal(dump_signal, lambda signum, frame: self.dump())
+        if interval is not None:
+            threading.Thread(target=self.dump_every, daemon=True).start()
+
+    def record(self, path, source, kind, received, sent=None):
+        if sent is None: sent = time.perf_counter()
+
+        key = (path, source, kind)
+        hist = self.hists.get(key)
+        if hist is None:
+            hist = self.hists[key] = [0]*len(BUCKETS)
+        hist[bisect_left(BUCKETS, sent - received)] += 1
+
+    def overrun(self):
+        self.overruns += 1
+
+    def percentile(self, key, q):
+        return percentile(self.hists[key], q)
+
+    def dump_every(self):
+        while True:
+            time.sleep(self.interval)
+            self.dump()
+
+    def dump(self):
+        # the recording threads carry on while this runs, so it works from a
+        # copy, taken before any new key can change the dict's size
+        hists = sorted((key, list(hist)) for key, hist in list(self.hists.items()))
+        out = self.out
+
+        out.write("%-40s %8s %8s %8s  %s\n" % ('path/source/type', 'count', 'p50<', 'p99<', ' '.join(bucket_label(b) for b in BUCKETS)))
+        for key, hist in hists:
+            out.write("%-40s %8d %8s %8s  %s\n" % ('/'.join(str(k) for k in key), sum(hist),
+                bucket_label(percentile(hist, 0.5)), bucket_label(percentile(hist, 0.99)),
+                ' '.join(str(count) for count in hist)))
+
+        if self.overruns:
+            out.write("frame overruns: %d\n" % (self.overruns))
+        out.flush()
+
+def percentile(hist, q):
+    # upper edge of the bucket the qth fraction of the counts falls in
+    target = q*sum(hist)
+    seen = 0
+    for edge, count in zip(BUCKETS, hist):
+        seen += count
+        if seen >= target:
+            return edge
+    return BUCKETS[-1]
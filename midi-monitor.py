@@ -1,21 +1,117 @@
 #! /usr/bin/python3
 import signal
 import sys
+import time
+import queue
+import argparse
+import threading
 import mido
 from string import Template
+from capture import Capture
+
+# types that can flood the terminal
+HIGH_RATE = ('clock', 'active_sensing', 'aftertouch', 'polytouch', 'pitchwheel', 'control_change')
 
 def printer(midi_dev_name, max_name_len):
     name_len = len(midi_dev_name)
     return lambda msg: print(midi_dev_name + ':' + ' '*( max_name_len - name_len )+ str(msg))
 
+def enqueuer(midi_dev_name, inbox):
+    # all the rtmidi thread does is hand the message over
+    put = inbox.put
+    return lambda msg: put((midi_dev_name, msg))
+
+class Writer(threading.Thread):
+    '''
+    renders what the port callbacks enqueue from a single thread, either as
+    batches of printed messages or as a table of rates refreshed every refresh
+    seconds
+    '''
+    def __init__(self, inbox, max_name_len, options):
+        threading.Thread.__init__(self, daemon=True)
+        self.inbox = inbox
+        self.max_name_len = max_name_len
+        self.stats = options.stats
+        self.refresh = options.refresh
+        self.suppress = frozenset(options.suppress or ())
+        self.sample = options.sample
+        self.running = True
+
+        self.counts = {}
+        self.last_cc = {}
+        self.seen = {}
+        self.since = time.monotonic()
+
+    def run(self):
+        get = self.inbox.get
+        next_render = time.monotonic() + self.refresh
+
+        while self.running:
+            batch = []
+            try:
+                batch.append(get(timeout=self.refresh))
+                while True:
+                    batch.append(get(block=False))
+            except queue.Empty:
+                pass
+
+            if self.stats:
+                self.tally(batch)
+                if time.monotonic() >= next_render:
+                    self.render()
+                    next_render = time.monotonic() + self.refresh
+            elif batch:
+                self.write(batch)
+
+    def keep(self, msg):
+        kind = msg.type
+        if kind in self.suppress: return False
+
+        if self.sample > 1 and kind in HIGH_RATE:
+            seen = self.seen[kind] = self.seen.get(kind, 0) + 1
+            return seen%self.sample == 1
 
-def open_ports(midi_dev_names):
-    longest_name = max([len(name) for name in  midi_dev_names])
+        return True
 
+    def write(self, batch):
+        lines = [name + ':' + ' '*(self.max_name_len - len(name)) + str(msg) for name, msg in batch if self.keep(msg)]
+        if lines:
+            sys.stdout.write('\n'.join(lines) + '\n')
+            sys.stdout.flush()
+
+    def tally(self, batch):
+        counts = self.counts
+        for name, msg in batch:
+            key = (name, msg.type)
+            counts[key] = counts.get(key, 0) + 1
+            if msg.type == 'control_change':
+                self.last_cc[(name, msg.channel, msg.control)] = msg.value
+
+    def render(self):
+        now = time.monotonic()
+        elapsed = max(now - self.since, 1e-6)
+
+        lines = ['\033[H\033[J%-*s %-16s %10s' % (self.max_name_len, 'port', 'type', 'msg/s')]
+        for (name, kind), count in sorted(self.counts.items()):
+            lines.append('%-*s %-16s %10.1f' % (self.max_name_len, name, kind, count/elapsed))
+
+        if self.last_cc:
+            lines.append('')
+            lines.append('%-*s %4s %4s %5s' % (self.max_name_len, 'port', 'ch', 'cc', 'value'))
+            for (name, channel, control), value in sorted(self.last_cc.items()):
+                lines.append('%-*s %4d %4d %5d' % (self.max_name_len, name, channel, control, value))
+
+        sys.stdout.write('\n'.join(lines) + '\n')
+        sys.stdout.flush()
+
+        self.counts = {}
+        self.since = now
+
+def open_ports(midi_dev_names, callback_for):
     monitored_ports = []
     for midi_dev_name in midi_dev_names:
         open_port = mido.open_input(midi_dev_name)
-        open_port.callback = printer(midi_dev_name, longest_name)
+        open_port.callback = callback_for(midi_dev_name)
         monitored_ports.append(open_port)
 
     return monitored_ports
@@ -24,7 +120,7 @@ def close_ports(monitored_ports):
     for port in monitored_ports:
         port.close()
 
-def setup_prompt():
+def setup_prompt(options):
     def signal_handler(signal, frame):
         print("\nBye")
         sys.exit(0)
@@ -35,21 +131,47 @@ def setup_prompt():
     print('choose input to monitor: \n', "\n".join([listing_template.substitute({'i':i, 'name':inputs[i]}) for i in range(len(inputs))]))
     choice = input("enter indicies: ")
     treated = set([int(index) for index in choice.split() if index.isdigit()])
-    setup_monitor(inputs, treated)
+    setup_monitor(inputs, treated, options)
 
-def setup_monitor(inputs, selected):
+def setup_monitor(inputs, selected, options):
     selected_dev_names = [inputs[x] for x in selected]
     print("showing midi for: \n",  '\n'.join(selected_dev_names))
+    longest_name = max([len(name) for name in selected_dev_names])
+    capture = Capture(options.capture) if options.capture else None
+
+    if options.direct:
+        writer = None
+        callback_for = lambda name: printer(name, longest_name)
+    else:
+        inbox = queue.SimpleQueue()
+        writer = Writer(inbox, longest_name, options)
+        writer.start()
+        callback_for = lambda name: enqueuer(name, inbox)
 
-    monitored = open_ports(selected_dev_names)
+    if capture is None:
+        monitored = open_ports(selected_dev_names, callback_for)
+    else:
+        monitored = open_ports(selected_dev_names, lambda name: capture.callback(name, callback_for(name)))
 
     def signal_handler(signal, frame):
         print('Closing connections')
         close_ports(monitored)
-        setup_prompt()
+        if capture is not None:
+            capture.close()
+        if writer is not None:
+            writer.running = False
+            writer.join()
+        setup_prompt(options)
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.pause()
 
 if(__name__=='__main__'):
-    setup_prompt()
+    parser = argparse.ArgumentParser(description="show midi coming in on chosen inputs")
+    parser.add_argument('--stats', action='store_true', help="show rates per port and type and the last value of each cc instead of messages")
+    parser.add_argument('--refresh', type=float, default=0.5, help="seconds between stats views, or between batches of printed messages at most")
+    parser.add_argument('--suppress', nargs='+', metavar='TYPE', help="message types not to print")
+    parser.add_argument('--sample', type=int, default=1, metavar='N', help="print only one in N of the high rate types: %s" % (', '.join(HIGH_RATE)))
+    parser.add_argument('--capture', metavar='FILE', help="append everything received to a capture file for capture.py to replay")
+    parser.add_argument('--direct', action='store_true', help="print from the port callbacks as they arrive")
+    setup_prompt(parser.parse_args())
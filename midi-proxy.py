@@ -1,7 +1,12 @@
 #! python3
 import mido
 import sys
+import time
 import signal
+import threading
+import argparse
+from latency import LatencyHistograms
+from capture import Capture
 
 def create_source(midi_dev_name):
     return  mido.open_input(midi_dev_name)
@@ -9,37 +14,239 @@ def create_source(midi_dev_name):
 def create_sink(midi_dev_name):
     return mido.open_output(midi_dev_name)
 
-def forwardMessage(sink):
-    def forwarder(msg):
+# stages each take the next step of the chain and return a callable that
+# handles a message, changing it in place and passing it on, or dropping it
+
+def channels(*allowed):
+    allowed = frozenset(allowed)
+    def stage(nxt):
+        def run(msg):
+            if not hasattr(msg, 'channel') or msg.channel in allowed:
+                nxt(msg)
+        return run
+    return stage
+
+def remap(mapping):
+    table = tuple(mapping.get(ch, ch) for ch in range(16))
+    def stage(nxt):
+        def run(msg):
+            if hasattr(msg, 'channel'):
+                msg.channel = table[msg.channel]
+            nxt(msg)
+        return run
+    return stage
+
+def transpose(semitones):
+    def stage(nxt):
+        def run(msg):
+            if msg.type == 'note_on' or msg.type == 'note_off':
+                note = msg.note + semitones
+                if note < 0 or note > 127: return
+                msg.note = note
+            nxt(msg)
+        return run
+    return stage
+
+def velocity_curve(gamma):
+    table = tuple(max(1, round(127*(v/127.0)**gamma)) if v else 0 for v in range(128))
+    def stage(nxt):
+        def run(msg):
+            if msg.type == 'note_on':
+                msg.velocity = table[msg.velocity]
+            nxt(msg)
+        return run
+    return stage
+
+def drop(*types):
+    types = frozenset(types)
+    def stage(nxt):
+        def run(msg):
+            if msg.type not in types:
+                nxt(msg)
+        return run
+    return stage
+
+def rate_limit(per_second, types=('control_change', 'pitchwheel', 'aftertouch', 'polytouch')):
+    # at most per_second messages of each type on each channel and controller.
+    # one coming too soon is held back, replacing any held before it, and sent
+    # once the interval is up, so the value a sweep ends on always gets through
+    interval = 1.0/per_second
+    types = frozenset(types)
+    def stage(nxt):
+        last = {}
+        held = {}
+        # sends are serialized, the held ones going out from their own thread
+        lock = threading.Lock()
+        wake = threading.Condition(lock)
 
-        if (msg.type != 'clock'):
-            sink.send(msg)
+        def send_held():
+            with wake:
+                while True:
+                    if not held:
+                        wake.wait()
+                        continue
+                    now = time.perf_counter()
+                    due = min(last[key] for key in held) + interval
+                    if due > now:
+                        wake.wait(due - now)
+                        continue
+                    for key in [key for key in held if last[key] + interval <= now]:
+                        last[key] = now
+                        nxt(held.pop(key))
+
+        threading.Thread(target=send_held, daemon=True).start()
+
+        def run(msg):
+            with lock:
+                if msg.type in types:
+                    key = (msg.type, msg.channel, getattr(msg, 'control', getattr(msg, 'note', None)))
+                    now = time.perf_counter()
+                    if now - last.get(key, -interval) < interval:
+                        if not held: wake.notify()
+                        held[key] = msg
+                        return
+                    # newer than anything still held, which it replaces
+                    held.pop(key, None)
+                    last[key] = now
+                nxt(msg)
+        return run
+    return stage
+
+def show():
+    def stage(nxt):
+        def run(msg):
             print(msg)
+            nxt(msg)
+        return run
+    return stage
+
+def fan_out(sinks):
+    # rtmidi sinks share one encoding of the message, any others get it from mido
+    raw = tuple(sink._rt.send_message for sink in sinks if getattr(sink, '_rt', None) is not None)
+    other = tuple(sink.send for sink in sinks if getattr(sink, '_rt', None) is None)
+
+    def emit(msg):
+        if raw:
+            data = msg.bytes()
+            for write in raw:
+                write(data)
+        for send in other:
+            send(msg)
+    return emit
+
+def build_chain(stages, sinks):
+    chain = fan_out(sinks)
+    for stage in reversed(stages):
+        chain = stage(chain)
+    return chain
 
+def forwardMessage(sinks, stages=(), latency=None, source_name='source'):
+    chain = build_chain(stages, sinks)
+    if latency is None:
+        return chain
+
+    record = latency.record
+    def forwarder(msg):
+        received = time.perf_counter()
+        chain(msg)
+        record('proxy', source_name, msg.type, received)
 
     return forwarder
 
-def connect(source, sink):
-    source.callback = forwardMessage(sink)
+def connect(source, sinks, stages=(), latency=None, capture=None):
+    name = getattr(source, 'name', 'source')
+    forwarder = forwardMessage(sinks, stages, latency, name)
+    # messages are captured as they arrived, before any stage changes them
+    source.callback = forwarder if capture is None else capture.callback(name, forwarder)
+
+def stages_from_args(args):
+    stages = []
+    if args.drop: stages.append(drop(*args.drop))
+    if args.channels: stages.append(channels(*args.channels))
+    if args.rate_limit: stages.append(rate_limit(args.rate_limit))
+    if args.remap: stages.append(remap(dict(tuple(int(ch) for ch in pair.split(':')) for pair in args.remap)))
+    if args.transpose: stages.append(transpose(args.transpose))
+    if args.velocity_curve: stages.append(velocity_curve(args.velocity_curve))
+    if args.verbose: stages.append(show())
+    return stages
+
+class NullSink:
+    def send(self, msg):
+        pass
+
+class NullRtMidi:
+    def send_message(self, data):
+        pass
+
+class NullRawSink:
+    def __init__(self):
+        self._rt = NullRtMidi()
+
+def bench(count):
+    messages = []
+    for i in range(count):
+        if i%4 == 3:
+            messages.append(mido.Message('control_change', channel=i%16, control=i%128, value=i%128))
+        elif i%2:
+            messages.append(mido.Message('note_off', channel=i%16, note=i%120))
+        else:
+            messages.append(mido.Message('note_on', channel=i%16, note=i%120, velocity=1 + i%127))
+
+    chains = [
+        ('no stages, 1 sink', [], [NullRawSink()]),
+        ('no stages, 3 sinks', [], [NullRawSink(), NullRawSink(), NullRawSink()]),
+        ('drop+remap+transpose+curve, 1 sink', [drop('clock'), remap({0: 1}), transpose(0), velocity_curve(1.0)], [NullRawSink()]),
+        ('all stages, 3 sinks', [drop('clock'), channels(*range(16)), rate_limit(1e9), remap({0: 1}), transpose(0), velocity_curve(1.0)], [NullRawSink(), NullRawSink(), NullRawSink()]),
+        ('all stages, 1 mido sink', [drop('clock'), channels(*range(16)), rate_limit(1e9), remap({0: 1}), transpose(0), velocity_curve(1.0)], [NullSink()]),
+    ]
+
+    for name, stages, sinks in chains:
+        chain = build_chain(stages, sinks)
+        start = time.perf_counter()
+        for msg in messages:
+            chain(msg)
+        elapsed = time.perf_counter() - start
+        print("%-38s %10.0f msg/s  %6.2f us/msg" % (name, count/elapsed, 1e6*elapsed/count))
 
 if __name__=='__main__':
-    inputPortName = sys.argv[1]
-    outputPortName  = sys.argv[2]
+    parser = argparse.ArgumentParser(description="forward midi from one port to others through a chain of transforms")
+    parser.add_argument('input', nargs='?')
+    parser.add_argument('outputs', nargs='*')
+    parser.add_argument('--channels', type=int, nargs='+', help="only pass these channels")
+    parser.add_argument('--remap', nargs='+', metavar='FROM:TO', help="move channels")
+    parser.add_argument('--transpose', type=int, default=0, help="semitones to shift notes by")
+    parser.add_argument('--velocity-curve', type=float, help="gamma applied to note on velocity")
+    parser.add_argument('--drop', nargs='*', default=['clock'], help="message types not to forward")
+    parser.add_argument('--rate-limit', type=float, help="max controller messages per second per controller")
+    parser.add_argument('--verbose', action='store_true', help="print each forwarded message")
+    parser.add_argument('--capture', metavar='FILE', help="append everything received to a capture file for capture.py to replay")
+    parser.add_argument('--bench', type=int, metavar='COUNT', help="measure throughput of a few chains and exit")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.bench)
+        sys.exit(0)
+
+    if args.input is None or not args.outputs:
+        parser.error("must provide input and output device names")
 
     try:
-        source = create_source(inputPortName)
-        sink = create_sink(outputPortName)
+        source = create_source(args.input)
+        sinks = [create_sink(name) for name in args.outputs]
     except OSError as err:
         print(err)
         sys.exit(1)
 
-    print("setting up link from '%s' to '%s'" % (inputPortName, outputPortName))
-    connect(source, sink)
+    print("setting up link from '%s' to '%s'" % (args.input, "', '".join(args.outputs)))
+    # kill -USR1 dumps the forwarding latency
+    capture = Capture(args.capture) if args.capture else None
+    connect(source, sinks, stages_from_args(args), LatencyHistograms(interval=60), capture)
 
     def signal_handler(signal, frame):
         print("closing ports and exiting")
+        if capture is not None:
+            capture.close()
         sys.exit(0)
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.pause()
-
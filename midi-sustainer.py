@@ -1,7 +1,10 @@
 #! python3
 import mido
 import sys
+import time
 import signal
+from latency import LatencyHistograms
+from raw_output import StagedPort
 
 def create_source(midi_dev_name):
     return  mido.open_input(midi_dev_name)
@@ -9,30 +12,35 @@ def create_source(midi_dev_name):
 def create_sink(midi_dev_name):
     return mido.open_output(midi_dev_name)
 
-def key_channel(message):
-    return (message.channel, message.note)
+# held and sounding state of every key on every channel is a bit each in a
+# 16*128 bit int, the bit of a key being at channel*128 + note
+ALL_KEYS = (1 << 16*128) - 1
 
-class Tape:
-    def __init__(self):
-        pass
+def key_bit(channel, note):
+    return 1 << (channel << 7 | note)
 
-class KeyState:
-    def __init__(self, message):
-        self.note = message.note
-        self.channel = message.channel
-        self.held = False
-        self.on = False
-        self.tape = Tape()
+def keys_in(mask):
+    # (channel, note) for every bit set, lowest first
+    while mask:
+        low = mask & -mask
+        yield divmod(low.bit_length() - 1, 128)
+        mask ^= low
 
 class Sustainer:
-    def __init__(self, output, sustainCC):
-        self.keys = dict()
+    def __init__(self, output, sustainCC, latency=None, source=None):
+        self.held = 0
+        self.on = 0
         self.output = output
+        # one batch per input message, timed from its receipt under the port
+        # it came in on
+        self.raw = StagedPort(output, 64, latency, 'sustainer', source)
         self.sustain = False
         self.sustainCC = sustainCC
         self.lock = False
 
     def send(self, message):
+        received = time.perf_counter()
+
         if message.type == 'control_change':
             if message.control == self.sustainCC:
                 if message.value == 127:
@@ -49,42 +57,34 @@ class Sustainer:
         elif message.type == 'note_off':
             self.noteOff(message)
         else:
-            self.output.send(message)
-
-    def getKeyState(self, message):
-        key = key_channel(message)
-        state = self.keys.get(key)
+            self.raw.send(message)
 
-        if (state is None):
-            state = KeyState(message)
-            self.keys[key] = state
-
-        return state
+        self.raw.flush(received, message.type)
 
     def heldNotes(self, is_held=True):
-        return filter(lambda ks: ks.held == is_held, self.keys.values())
+        return keys_in(self.held if is_held else ~self.held & ALL_KEYS)
     def onNotes(self, is_on=True):
-        return filter(lambda ks: ks.on == is_on, self.keys.values())
+        return keys_in(self.on if is_on else ~self.on & ALL_KEYS)
 
     def noteOn(self, message):
-        keystate = self.getKeyState(message)
-        keystate.held = True
+        bit = key_bit(message.channel, message.note)
+        self.held |= bit
 
-        if (self.sustain or self.lock) and keystate.on:
-            self.output.send(mido.Message('note_off', note=keystate.note, channel=keystate.channel))
+        if (self.sustain or self.lock) and self.on & bit:
+            self.raw.note_off(message.channel, message.note)
 
-        self.output.send(message)
+        self.raw.note_on(message.channel, message.note, message.velocity)
 
-        keystate.on = True
+        self.on |= bit
 
     def noteOff(self, message):
-        keystate = self.getKeyState(message)
-        keystate.held = False
+        bit = key_bit(message.channel, message.note)
+        self.held &= ~bit
 
         #note off only turns off when sustain and lock are off
         if not (self.sustain or self.lock):
-            self.output.send(message)
-            keystate.on = False
+            self.raw.note_off(message.channel, message.note, message.velocity)
+            self.on &= ~bit
 
     def lockOn(self):
         self.lock = True
@@ -105,16 +105,20 @@ class Sustainer:
             self.turnOffUnheld()
 
     def turnOffUnheld(self):
-        for ks in self.keys.values():
-            if ks.on and not ks.held:
-                self.output.send(mido.Message('note_off', note=ks.note, channel=ks.channel))
-                ks.on = False
+        # exactly the keys still sounding that are no longer held
+        release = self.on & ~self.held
+        if not release: return
+
+        note_off = self.raw.note_off
+        for channel, note in keys_in(release):
+            note_off(channel, note)
+        self.on &= self.held
 
     def panic():
         pass
 
-def connect(source, sink):
-    sustainer = Sustainer(sink, 64)
+def connect(source, sink, latency=None):
+    sustainer = Sustainer(sink, 64, latency, source.name)
     source.callback = lambda msg: sustainer.send(msg)
 
 if __name__=='__main__':
@@ -132,7 +136,8 @@ if __name__=='__main__':
         sys.exit(1)
 
     print("setting up sustain from '%s' to '%s'" % (inputPortName, outputPortName))
-    connect(source, sink)
+    # kill -USR1 dumps the latency through the sustainer
+    connect(source, sink, LatencyHistograms(interval=60))
 
     def signal_handler(signal, frame):
         print("closing ports and exiting")
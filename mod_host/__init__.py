@@ -1,7 +1,9 @@
 import re
 import subprocess as sub
 import socket 
+import threading
 from time import sleep
+from .catalog import Catalog
 LV2_BUNDLES = ['/home/pi/lv2plugins']
 
 Errors = {
@@ -30,65 +32,98 @@ Errors = {
         -902:   "ERR_INVALID_OPERATION"
 }
 
+response_re = re.compile(r"resp (\-?\d+)(?: (.*))?", re.DOTALL)
+
+def decode_response(resp):
+    m = response_re.match(resp)
+
+    if (m is None):
+        raise Exception("unknown response: "+resp)
+
+    code = int(m.group(1))
+    if code in Errors:
+        raise Exception(Errors[code])
+
+    value = m.group(2)
+    if value is None:
+        return code
+
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
 class Plugin:
-    def __init__(self, client, index, name):
-        self.uri = "https://faustlv2.bitbucket.io/%s"%(name)
+    '''
+    an instance on the host, each method returns whatever its client's
+    send_command does, so with an AsyncClient they are awaitables
+    '''
+    def __init__(self, client, index, name, instance=None):
+        # name may be a uri, a plugin name or the last part of its uri
+        uri = None if client.catalog is None else client.catalog.uri(name)
+        self.uri = uri or "https://faustlv2.bitbucket.io/%s"%(name)
         self.client = client
         self.index = index
-        self.name = name if not name in client.liveplugins else name+index
-        result = self.client.send_command("add %s %d" % (self.uri, index))
+        self.plugin_name = name
+        self.params = {}
+
+        if instance is None:
+            instance = name if not name in client.liveplugins else name+str(index)
+        self.name = instance
+        self.added = self.client.send_command("add %s %d" % (self.uri, index))
 
     def remove(self):
-        self.message('remove', [])
+        return self.message('remove', [])
 
     def message(self, command, args):
-        self.client.send_command("%s %d %s" % (command, self.index, " ".join(args)))
+        return self.client.send_command("%s %d %s" % (command, self.index, " ".join(str(arg) for arg in args)))
 
     def preset_load(self, preset_uri):
-        self.message('preset_load', [preset_uri])
+        return self.message('preset_load', [preset_uri])
 
     def preset_save(self, preset_name, file_name):
-        self.message('preset_save', [preset_name, file_name])
+        return self.message('preset_save', [preset_name, file_name])
 
     def preset_show(self, preset_uri):
-        self.message('preset_show', [preset_uri])
+        return self.message('preset_show', [preset_uri])
 
     def bypass(self, value):
-        self.message('bypass', [value])
+        return self.message('bypass', [value])
 
     def param_set(self, symbol, value):
-        self.message('param_set',[symbol, value])
+        self.params[symbol] = value
+        return self.message('param_set',[symbol, value])
 
     def param_get(self, symbol):
-        self.message('param_get',[symbol])
+        return self.message('param_get',[symbol])
 
     def param_monitor(self, symbol, cond, value):
-        self.message('param_monitor',[symbol, cond, value])
+        return self.message('param_monitor',[symbol, cond, value])
 
     def licencee(self):
-        self.message('licencee', [])
+        return self.message('licencee', [])
 
     def monitor_output(self, symbol):
-        self.message('monitor_output')
+        return self.message('monitor_output')
 
     def midi_learn(self, symbol, minimum, maximum):
-        self.message('midi_learn', [symbol, minimum, maximum])
+        return self.message('midi_learn', [symbol, minimum, maximum])
 
     def midi_map(self, symbol, midi_channel, midi_cc, minimum, maximum):
-        self.message('midi_map', [midi_channel, midi_cc, minimum, maximum])
+        return self.message('midi_map', [midi_channel, midi_cc, minimum, maximum])
 
     def midi_unmap(self, symbol):
-        self.message('midi_unmap', [symbol])
+        return self.message('midi_unmap', [symbol])
 
     def cc_map(self, symbol, device_id, actuator_id, label, value, minimum, maximum):
-        self.message('cc_map',[symbol, device_id, actuator_id, label, value, minimum, maximum])
+        return self.message('cc_map',[symbol, device_id, actuator_id, label, value, minimum, maximum])
 
     def cc_unmap(self, symbol):
-        self.message('cc_map',[symbol])
+        return self.message('cc_map',[symbol])
 
 class Client:
 
-    def __init__(self, port=5000, internal=False):
+    def __init__(self, port=5000, internal=False, catalog=None):
         if(internal):
             self.spawn_server()
 
@@ -96,6 +131,10 @@ class Client:
         self.port = port
         self.plugi = 0
         self.liveplugins = {}
+        self.bundles = set()
+        self.connections = set()
+        self.lock = threading.Lock() # held while a command waits on its reply
+        self.catalog = catalog
         self.response_re = re.compile(r"resp (\-?\d*)")
 
     def spawn_server(self):
@@ -105,12 +144,15 @@ class Client:
         self.socket = socket.create_connection(('localhost', port))
 
     def list_plugins(self):
-        sub.run(['lv2ls', '-n'], shell=True).stdout
+        if self.catalog is None:
+            self.catalog = Catalog(LV2_BUNDLES)
+        return [plugin['uri'] for plugin in self.catalog.plugins()]
 
     def send_command(self, command):
         print("sending ", command)
-        self.socket.send(bytes(command, 'utf-8'))
-        resp = self.socket.recv(1024).decode()
+        with self.lock:
+            self.socket.send(bytes(command, 'utf-8'))
+            resp = self.socket.recv(1024).decode()
         m = self.response_re.match(resp)
 
         if (m is None):
@@ -128,15 +170,37 @@ class Client:
         self.socket.close()
 
     def add_bundle(self, path):
-        return self.send_command("bundle_add %s" % (path)) 
+        resp = self.send_command("bundle_add %s" % (path)) 
+        self.bundles.add(path)
+        return resp
 
-    def add_plugin(self, name):
-        plugin = Plugin(self, self.plugi, name)
+    def add_plugin(self, name, instance=None):
+        plugin = Plugin(self, self.plugi, name, instance)
         self.liveplugins[plugin.name] = plugin
         self.plugi = self.plugi+1
+        return plugin
+
+    def rm_plugin(self, instance):
+        plugin = self.liveplugins.pop(instance)
+        plugin.remove()
+
+        # the host drops the connections of removed instances itself
+        prefix = "effect_%d:" % (plugin.index)
+        self.connections = set(c for c in self.connections if not (c[0].startswith(prefix) or c[1].startswith(prefix)))
 
     def rm_bundle(self, path):
         self.send_command("bundle_remove %s"%(path))
+        self.bundles.discard(path)
+
+    def connect_ports(self, origin, destination):
+        resp = self.send_command("connect %s %s" % (origin, destination))
+        self.connections.add((origin, destination))
+        return resp
+
+    def disconnect_ports(self, origin, destination):
+        resp = self.send_command("disconnect %s %s" % (origin, destination))
+        self.connections.discard((origin, destination))
+        return resp
 
 
 if __name__== '__main__':
@@ -0,0 +1,94 @@
+import asyncio
+from collections import deque
+from . import Plugin, decode_response
+
+class AsyncClient:
+    '''
+    pipelines commands to mod-host, writing each one as soon as it is sent and
+    resolving the futures in order as the null terminated replies come back
+    '''
+    def __init__(self, port=5000, catalog=None):
+        self.port = port
+        self.catalog = catalog
+        self.plugi = 0
+        self.liveplugins = {}
+        self.pending = deque()
+        self.buffer = b''
+        self.reader = None
+        self.writer = None
+
+    async def connect_to_server(self, port=None):
+        if port is not None: self.port = port
+        self.reader, self.writer = await asyncio.open_connection('localhost', self.port)
+        self.receiver = asyncio.ensure_future(self.receive())
+
+    def send_command(self, command):
+        future = asyncio.get_event_loop().create_future()
+        self.pending.append(future)
+        self.writer.write(bytes(command, 'utf-8') + b'\0')
+        return future
+
+    async def receive(self):
+        try:
+            while True:
+                data = await self.reader.read(4096)
+                if not data: break
+
+                # replies can be split across reads or several to a read
+                frames = (self.buffer + data).split(b'\0')
+                self.buffer = frames.pop()
+
+                for frame in frames:
+                    if not frame or not self.pending: continue
+                    future = self.pending.popleft()
+                    if future.cancelled(): continue
+
+                    try:
+                        future.set_result(decode_response(frame.decode()))
+                    except Exception as e:
+                        future.set_exception(e)
+        finally:
+            while self.pending:
+                future = self.pending.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError("mod-host connection closed"))
+
+    async def drain(self):
+        await self.writer.drain()
+
+    async def add_bundle(self, path):
+        return await self.send_command("bundle_add %s" % (path))
+
+    async def rm_bundle(self, path):
+        return await self.send_command("bundle_remove %s" % (path))
+
+    async def add_plugin(self, name):
+        # the index is taken up front so adds in flight together get their
+        # own, but the plugin only counts as live once the host has added it
+        index = self.plugi
+        self.plugi = self.plugi+1
+        plugin = Plugin(self, index, name)
+        try:
+            await plugin.added
+        except BaseException:
+            if self.plugi == index+1:
+                self.plugi = index
+            raise
+
+        if plugin.name in self.liveplugins:
+            plugin.name = name+str(index)
+        self.liveplugins[plugin.name] = plugin
+        return plugin
+
+    async def disconnect(self):
+        await asyncio.gather(*(v.remove() for v in self.liveplugins.values()), return_exceptions=True)
+        self.liveplugins = {}
+
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.receiver.cancel()
+
+async def open_client(port=5000, catalog=None):
+    client = AsyncClient(port, catalog)
+    await client.connect_to_server()
+    return client
@@ -0,0 +1,80 @@
+#! /usr/bin/python3
+# throughput and latency of the mod-host control path against the fake host
+#   python3 -m mod_host.bench [count] [latency seconds]
+import os
+import sys
+import time
+import asyncio
+import contextlib
+from . import Client
+from .aio import open_client
+from .fake_host import FakeHost
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q*len(ordered)))]
+
+def report(name, samples, elapsed):
+    print("%-22s %8.0f op/s   p50 %7.3f ms   p99 %7.3f ms" % (
+        name, len(samples)/elapsed, 1000*percentile(samples, 0.5), 1000*percentile(samples, 0.99)))
+
+def timed(count, operation):
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        t = time.perf_counter()
+        operation(i)
+        samples.append(time.perf_counter() - t)
+    return samples, time.perf_counter() - start
+
+def bench_client(port, count):
+    # the blocking client prints each command, keep that off the terminal
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        client = Client(port)
+        plugin = client.add_plugin('organ')
+
+        results = [
+            ('Client.send_command', timed(count, lambda i: client.send_command("param_set 0 gain %f" % (i/count)))),
+            ('Plugin.param_set', timed(count, lambda i: plugin.param_set('gain', i/count))),
+            ('Plugin.param_get', timed(count, lambda i: plugin.param_get('gain'))),
+            ('add_plugin/rm_plugin', timed(count//10, lambda i: client.rm_plugin(client.add_plugin('organ', 'bench').name))),
+        ]
+
+        client.disconnect()
+
+    for name, (samples, elapsed) in results:
+        report(name, samples, elapsed)
+
+async def bench_async(port, count, window=32):
+    client = await open_client(port)
+    plugin = await client.add_plugin('organ')
+
+    # up to window commands in flight at once, each timed from its own send to
+    # its reply rather than from when the whole run was queued
+    samples = []
+    in_flight = set()
+    start = time.perf_counter()
+    for i in range(count):
+        if len(in_flight) >= window:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+
+        future = plugin.param_set('gain', i/count)
+        future.add_done_callback(lambda f, t=time.perf_counter(): samples.append(time.perf_counter() - t))
+        in_flight.add(future)
+    await asyncio.gather(*in_flight)
+    elapsed = time.perf_counter() - start
+
+    await client.disconnect()
+    report('AsyncClient, %d deep' % (window), samples, elapsed)
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    host = FakeHost(latency=latency).start()
+    print("fake mod-host on port %d, %d commands, %.1f ms latency" % (host.port, count, 1000*latency))
+
+    bench_client(host.port, count)
+    asyncio.run(bench_async(host.port, count))
+
+    host.stop()
@@ -0,0 +1,226 @@
+import os
+import re
+import json
+
+DEFAULT_INDEX = os.path.join(os.path.expanduser('~'), '.cache', 'pimu', 'lv2-catalog.json')
+
+prefix_re = re.compile(r"@prefix\s+([\w\-]*):\s*<([^>]*)>\s*\.")
+subject_re = re.compile(r"<([^>]+)>\s+a\s+[^;.]*lv2:Plugin")
+see_also_re = re.compile(r"rdfs:seeAlso\s+<([^>]+)>")
+name_re = re.compile(r"doap:name\s+\"([^\"]*)\"")
+
+def ttl_value(block, predicate):
+    m = re.search(predicate + r"\s+(\"[^\"]*\"|[^\s;\]]+)", block)
+    if m is None: return None
+
+    value = m.group(1).strip('"')
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def bundle_mtime(bundle):
+    # a bundle changes when any of its turtle files, or the listing, does
+    mtime = os.stat(bundle).st_mtime
+    for entry in os.scandir(bundle):
+        if entry.name.endswith('.ttl'):
+            mtime = max(mtime, entry.stat().st_mtime)
+    return mtime
+
+def expand_prefixes(text):
+    # only lv2, doap and rdfs terms are looked for, so rename any other prefixes
+    # bound to those namespaces to the usual ones
+    usual = {
+        'http://lv2plug.in/ns/lv2core#': 'lv2',
+        'http://usefulinc.com/ns/doap#': 'doap',
+        'http://www.w3.org/2000/01/rdf-schema#': 'rdfs',
+    }
+    for prefix, uri in prefix_re.findall(text):
+        if uri in usual and prefix != usual[uri]:
+            text = re.sub(r"(?<![\w\-])%s:" % (re.escape(prefix)), usual[uri] + ':', text)
+    return text
+
+def scan(text, start=0):
+    # the brackets and full stops outside string literals, with how many blank
+    # nodes deep each lies. a bracket counts as outside the node it opens or
+    # closes
+    depth = 0
+    quoted = False
+    for i in range(start, len(text)):
+        c = text[i]
+        if c == '"':
+            quoted = not quoted
+        elif not quoted:
+            if c == '[':
+                yield i, c, depth
+                depth += 1
+            elif c == ']':
+                depth -= 1
+                yield i, c, depth
+            elif c == '.':
+                yield i, c, depth
+
+def subject_blocks(text, uri):
+    # the statements about a subject, up to the full stop that ends each
+    blocks = []
+    start = text.find('<%s>' % (uri))
+
+    while start >= 0:
+        end = len(text)
+        for i, c, depth in scan(text, start):
+            if c == '.' and depth == 0 and (i + 1 == len(text) or text[i + 1].isspace()):
+                end = i
+                break
+
+        blocks.append(text[start:end])
+        start = text.find('<%s>' % (uri), end)
+
+    return blocks
+
+def blank_nodes(block):
+    # the outermost [ ... ] in the statements, each with any blank nodes
+    # nested inside it, like scale points, left out
+    nodes = []
+    parts = []
+    start = 0
+    for i, c, depth in scan(block):
+        if c == '[' and depth == 0:
+            parts = []
+            start = i + 1
+        elif c == '[' and depth == 1:
+            parts.append(block[start:i])
+        elif c == ']' and depth == 1:
+            start = i + 1
+        elif c == ']' and depth == 0:
+            parts.append(block[start:i])
+            nodes.append(''.join(parts))
+    return nodes
+
+def read_ttl(path):
+    with open(path) as f:
+        return expand_prefixes(f.read())
+
+def scan_bundle(bundle):
+    '''
+    reads the plugins described by a bundle's manifest.ttl and the files it
+    points to, picking out uris, names and input control ports
+    '''
+    manifest = os.path.join(bundle, 'manifest.ttl')
+    if not os.path.exists(manifest): return []
+
+    text = read_ttl(manifest)
+    documents = [text]
+    for see_also in set(see_also_re.findall(text)):
+        path = os.path.join(bundle, see_also)
+        if see_also.endswith('.ttl') and os.path.exists(path):
+            documents.append(read_ttl(path))
+
+    plugins = []
+    for uri in subject_re.findall(text):
+        plugin = {'uri': uri, 'name': uri.rstrip('/').rsplit('/', 1)[-1], 'ports': []}
+
+        for body in (block for document in documents for block in subject_blocks(document, uri)):
+            m = name_re.search(body)
+            if m is not None:
+                plugin['name'] = m.group(1)
+
+            for block in blank_nodes(body):
+                if 'lv2:ControlPort' in block and 'lv2:InputPort' in block:
+                    plugin['ports'].append({
+                        'symbol': ttl_value(block, 'lv2:symbol'),
+                        'name': ttl_value(block, 'lv2:name'),
+                        'default': ttl_value(block, 'lv2:default'),
+                        'minimum': ttl_value(block, 'lv2:minimum'),
+                        'maximum': ttl_value(block, 'lv2:maximum'),
+                    })
+
+        plugins.append(plugin)
+
+    return plugins
+
+class Catalog:
+    '''
+    index of the lv2 plugins under the bundle directories, kept on disk and
+    rescanned only for bundles whose turtle files have changed since
+    '''
+    def __init__(self, bundle_dirs, index_path=DEFAULT_INDEX):
+        self.bundle_dirs = bundle_dirs
+        self.index_path = index_path
+        self.bundles = {}
+        self.load()
+
+        if self.refresh():
+            self.save()
+
+    def load(self):
+        try:
+            with open(self.index_path) as f:
+                self.bundles = json.load(f)
+        except (OSError, ValueError):
+            self.bundles = {}
+
+        self.build_lookups()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.bundles, f)
+        os.replace(tmp, self.index_path)
+
+    def refresh(self):
+        '''
+        rescans new and modified bundles and forgets removed ones, returns
+        whether anything changed
+        '''
+        seen = set()
+        changed = False
+
+        for directory in self.bundle_dirs:
+            if not os.path.isdir(directory): continue
+
+            for entry in os.scandir(directory):
+                if not (entry.is_dir() and entry.name.endswith('.lv2')): continue
+
+                bundle = entry.path
+                seen.add(bundle)
+                mtime = bundle_mtime(bundle)
+                known = self.bundles.get(bundle)
+
+                if known is None or known['mtime'] != mtime:
+                    self.bundles[bundle] = {'mtime': mtime, 'plugins': scan_bundle(bundle)}
+                    changed = True
+
+        for bundle in set(self.bundles) - seen:
+            del self.bundles[bundle]
+            changed = True
+
+        if changed:
+            self.build_lookups()
+        return changed
+
+    def build_lookups(self):
+        self.by_uri = {}
+        self.by_name = {}
+        self.bundle_of = {}
+
+        for bundle, entry in self.bundles.items():
+            for plugin in entry['plugins']:
+                self.by_uri[plugin['uri']] = plugin
+                self.by_name.setdefault(plugin['name'], plugin)
+                self.by_name.setdefault(plugin['uri'].rstrip('/').rsplit('/', 1)[-1], plugin)
+                self.bundle_of[plugin['uri']] = bundle
+
+    def plugins(self):
+        return self.by_uri.values()
+
+    def find(self, name):
+        return self.by_uri.get(name) or self.by_name.get(name)
+
+    def uri(self, name):
+        plugin = self.find(name)
+        return None if plugin is None else plugin['uri']
+
+    def symbols(self, name):
+        plugin = self.find(name)
+        return [] if plugin is None else [port['symbol'] for port in plugin['ports']]
@@ -0,0 +1,72 @@
+import time
+import threading
+
+class ParamCoalescer:
+    '''
+    sits in front of Plugin.param_set for streams of knob movements, keeping only
+    the latest value per (instance, symbol) and sending them at most rate times
+    a second, as soon as the client's socket is free. a rate of None sends
+    whenever the socket is idle
+    '''
+    def __init__(self, rate=30):
+        self.interval = 0 if rate is None else 1.0/rate
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.running = True
+        self.last_flush = 0
+
+        self.received = 0
+        self.superseded = 0
+        self.sent = 0
+        self.failed = 0 # values the host refused or that could not be sent
+        self.error = None # the last of those failures
+
+        self.flusher = threading.Thread(target=self.run, daemon=True)
+        self.flusher.start()
+
+    def param_set(self, plugin, symbol, value):
+        with self.lock:
+            key = (plugin.index, symbol)
+            if key in self.pending:
+                self.superseded += 1
+            self.pending[key] = (plugin, symbol, value)
+            self.received += 1
+
+        self.wake.set()
+
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+
+        # one value the host refuses must not cost the rest of the batch, nor
+        # the flusher thread everything after it
+        for plugin, symbol, value in pending.values():
+            try:
+                plugin.param_set(symbol, value)
+            except Exception as e:
+                self.failed += 1
+                self.error = e
+            else:
+                self.sent += 1
+
+        self.last_flush = time.monotonic()
+
+    def run(self):
+        while self.running:
+            self.wake.wait()
+            self.wake.clear()
+
+            wait = self.last_flush + self.interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            # param_set blocks on the client's socket, values keep coalescing meanwhile
+            self.flush()
+
+    def close(self):
+        self.running = False
+        self.wake.set()
+        self.flusher.join()
+        self.flush()
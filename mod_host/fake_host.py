@@ -0,0 +1,221 @@
+import time
+import socket
+import queue
+import threading
+from collections import deque
+import socketserver
+
+class FakeHostHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        host = self.server.host
+        # replies go out as soon as they are due, not held back by nagle until
+        # the client acknowledges the last
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        replies = queue.SimpleQueue()
+        sender = threading.Thread(target=self.send_replies, args=(replies,), daemon=True)
+        sender.start()
+        try:
+            self.receive(host, replies)
+        finally:
+            replies.put(None)
+            sender.join()
+
+    def receive(self, host, replies):
+        buffer = b''
+        terminated = False
+
+        while True:
+            data = self.request.recv(4096)
+            if not data: return
+            arrived = time.monotonic()
+
+            # the async client null terminates commands, the blocking one sends
+            # one bare command at a time
+            commands = (buffer + data).split(b'\0')
+            buffer = commands.pop()
+            terminated = terminated or len(commands) > 0
+
+            if not terminated and buffer:
+                commands.append(buffer)
+                buffer = b''
+
+            # each reply is due its latency after its command came in, however
+            # many are in flight, as over a link with that round trip
+            for command in commands:
+                command = command.decode().strip()
+                if command:
+                    reply = host.execute(command)
+                    replies.put((arrived + host.latency_of(command.split()[0]), bytes(reply, 'utf-8') + b'\0'))
+
+    def send_replies(self, replies):
+        # in order, each once it is due, with any others due by then
+        waiting = deque()
+        while True:
+            if not waiting:
+                waiting.append(replies.get())
+            try:
+                while True:
+                    waiting.append(replies.get_nowait())
+            except queue.Empty:
+                pass
+
+            if waiting[0] is None: return
+            wait = waiting[0][0] - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+                continue
+
+            batch = []
+            now = time.monotonic()
+            while waiting and waiting[0] is not None and waiting[0][0] <= now:
+                batch.append(waiting.popleft()[1])
+            try:
+                self.request.sendall(b''.join(batch))
+            except OSError:
+                return
+
+class FakeHost:
+    '''
+    an in-process stand-in for mod-host speaking its socket protocol, keeping
+    enough state to answer with the same error codes. latency is the time in
+    seconds from a command arriving to its reply going out, or a dict of them
+    by command name. replies are delayed independently, like a round trip,
+    rather than the host taking that long over each in turn
+
+    known_uris and symbols, when given, restrict which plugins can be added and
+    which params they have: symbols maps a uri to its param symbols
+    '''
+    def __init__(self, port=0, latency=0, known_uris=None, symbols=None):
+        self.latency = latency
+        self.known_uris = known_uris
+        self.symbols = symbols or {}
+        self.instances = {}
+        self.bundles = set()
+        self.connections = set()
+        self.presets = {}
+        self.commands = 0
+        self.lock = threading.Lock()
+
+        self.server = socketserver.ThreadingTCPServer(('localhost', port), FakeHostHandler)
+        self.server.daemon_threads = True
+        self.server.host = self
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def latency_of(self, name):
+        return self.latency.get(name, 0) if isinstance(self.latency, dict) else self.latency
+
+    def execute(self, command):
+        parts = command.split()
+        name, args = parts[0], parts[1:]
+
+        with self.lock:
+            self.commands += 1
+            handler = getattr(self, 'do_' + name, None)
+
+            if handler is None:
+                return "resp -902"
+
+            try:
+                result = handler(*args)
+            except (TypeError, ValueError):
+                return "resp -902"
+
+        return "resp %s" % (result if isinstance(result, str) else "%d" % (result))
+
+    def do_add(self, uri, index):
+        index = int(index)
+        if index < 0 or index > 9999: return -1
+        if index in self.instances: return -2
+        if self.known_uris is not None and uri not in self.known_uris: return -101
+
+        self.instances[index] = {'uri': uri, 'params': {}, 'bypass': 0}
+        return index
+
+    def do_remove(self, index):
+        index = int(index)
+        if index == -1:
+            self.instances.clear()
+            return 0
+        if index not in self.instances: return -3
+
+        del self.instances[index]
+        prefix = "effect_%d:" % (index)
+        self.connections = set(c for c in self.connections if not (c[0].startswith(prefix) or c[1].startswith(prefix)))
+        return 0
+
+    def do_bundle_add(self, path):
+        self.bundles.add(path)
+        return 0
+
+    def do_bundle_remove(self, path):
+        self.bundles.discard(path)
+        return 0
+
+    def param_target(self, index, symbol):
+        index = int(index)
+        if index not in self.instances: return -3, None
+
+        plugin = self.instances[index]
+        known = self.symbols.get(plugin['uri'])
+        if known is not None and symbol not in known: return -103, None
+
+        return 0, plugin
+
+    def do_param_set(self, index, symbol, value):
+        code, plugin = self.param_target(index, symbol)
+        if code < 0: return code
+
+        plugin['params'][symbol] = float(value)
+        return 0
+
+    def do_param_get(self, index, symbol):
+        code, plugin = self.param_target(index, symbol)
+        if code < 0: return code
+
+        return "0 %f" % (plugin['params'].get(symbol, 0.0))
+
+    def do_bypass(self, index, value):
+        index = int(index)
+        if index not in self.instances: return -3
+
+        self.instances[index]['bypass'] = int(value)
+        return 0
+
+    def do_connect(self, origin, destination):
+        self.connections.add((origin, destination))
+        return 0
+
+    def do_disconnect(self, origin, destination):
+        if (origin, destination) not in self.connections: return -206
+
+        self.connections.discard((origin, destination))
+        return 0
+
+    def do_preset_save(self, index, name, file_name):
+        index = int(index)
+        if index not in self.instances: return -3
+
+        self.presets["file://%s" % (file_name)] = dict(self.instances[index]['params'])
+        return 0
+
+    def do_preset_load(self, index, preset_uri):
+        index = int(index)
+        if index not in self.instances: return -3
+        if preset_uri not in self.presets: return -104
+
+        self.instances[index]['params'].update(self.presets[preset_uri])
+        return 0
+
+    def do_preset_show(self, index, preset_uri):
+        if preset_uri not in self.presets: return -104
+        return 0
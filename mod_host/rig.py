@@ -0,0 +1,72 @@
+import time
+
+class Rig:
+    '''
+    a description of what should be running on the host: bundles, named plugin
+    instances with their params, and connections between jack ports. ports of
+    an instance can be written as "<instance>:<port>"
+
+    Rig(bundles=["/home/pi/lv2plugins/faust.lv2"],
+        plugins={'lead': ('organ', {'gain': 0.5})},
+        connections=[('lead:out0', 'system:playback_1')])
+    '''
+    def __init__(self, bundles=(), plugins=None, connections=()):
+        self.bundles = set(bundles)
+        self.plugins = dict(plugins or {})
+        self.connections = set(connections)
+
+    def resolve(self, port, client):
+        instance, sep, symbol = port.partition(':')
+        plugin = client.liveplugins.get(instance)
+
+        if sep and instance in self.plugins and plugin is not None:
+            return "effect_%d:%s" % (plugin.index, symbol)
+        return port
+
+    def apply(self, client):
+        '''
+        bring the client's live state in line with this rig, sending only the
+        commands for what differs, returns counts of each change made
+        '''
+        start = time.perf_counter()
+        report = dict.fromkeys(['bundles_added', 'bundles_removed', 'plugins_added',
+            'plugins_removed', 'params_set', 'connected', 'disconnected'], 0)
+
+        for path in self.bundles - client.bundles:
+            client.add_bundle(path)
+            report['bundles_added'] += 1
+
+        for instance, plugin in list(client.liveplugins.items()):
+            wanted = self.plugins.get(instance)
+            if wanted is None or wanted[0] != plugin.plugin_name:
+                client.rm_plugin(instance)
+                report['plugins_removed'] += 1
+
+        for instance, (name, params) in self.plugins.items():
+            plugin = client.liveplugins.get(instance)
+
+            if plugin is None:
+                plugin = client.add_plugin(name, instance)
+                report['plugins_added'] += 1
+
+            for symbol, value in params.items():
+                if plugin.params.get(symbol) != value:
+                    plugin.param_set(symbol, value)
+                    report['params_set'] += 1
+
+        wanted = set((self.resolve(a, client), self.resolve(b, client)) for a, b in self.connections)
+
+        for origin, destination in client.connections - wanted:
+            client.disconnect_ports(origin, destination)
+            report['disconnected'] += 1
+
+        for origin, destination in wanted - client.connections:
+            client.connect_ports(origin, destination)
+            report['connected'] += 1
+
+        for path in client.bundles - self.bundles:
+            client.rm_bundle(path)
+            report['bundles_removed'] += 1
+
+        report['seconds'] = time.perf_counter() - start
+        return report
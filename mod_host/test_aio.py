@@ -0,0 +1,61 @@
+#! /usr/bin/python3
+# replies to pipelined commands, however the reads split or merge them
+#   python3 -m unittest mod_host.test_aio
+import asyncio
+import unittest
+from .aio import AsyncClient
+
+class Writer:
+    def __init__(self):
+        self.written = b''
+
+    def write(self, data):
+        self.written += data
+
+class AsyncClientTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # the client fed straight from a stream reader rather than a socket
+        self.client = AsyncClient()
+        self.client.reader = asyncio.StreamReader()
+        self.client.writer = Writer()
+        self.receiver = asyncio.ensure_future(self.client.receive())
+
+    async def asyncTearDown(self):
+        self.receiver.cancel()
+
+    async def replies(self, count, *chunks):
+        futures = [self.client.send_command("param_get %d gain" % (i)) for i in range(count)]
+        for chunk in chunks:
+            self.client.reader.feed_data(chunk)
+            await asyncio.sleep(0)
+        return await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), 1)
+
+    async def test_commands_go_out_null_terminated(self):
+        futures = [self.client.send_command("add urn:test:gate 0"), self.client.send_command("remove 0")]
+        self.assertEqual(self.client.writer.written, b'add urn:test:gate 0\0remove 0\0')
+        self.client.reader.feed_data(b'resp 0\0resp 0\0')
+        self.assertEqual(await asyncio.gather(*futures), [0, 0])
+
+    async def test_several_replies_in_one_read(self):
+        self.assertEqual(await self.replies(3, b'resp 0 0.5\0resp 0 1\0resp 0 2.25\0'), [0.5, 1.0, 2.25])
+
+    async def test_reply_split_across_reads(self):
+        self.assertEqual(await self.replies(2, b'resp 0 0', b'.5\0re', b'sp 0 ', b'1\0'), [0.5, 1.0])
+
+    async def test_a_byte_at_a_time(self):
+        data = b'resp 0 0.5\0resp -3\0resp 0 idle\0'
+        results = await self.replies(3, *(data[i:i + 1] for i in range(len(data))))
+        self.assertEqual(results[0], 0.5)
+        self.assertEqual(str(results[1]), "ERR_INSTANCE_NON_EXISTS")
+        self.assertEqual(results[2], 'idle')
+
+    async def test_closed_connection_fails_what_is_waiting(self):
+        futures = [self.client.send_command("remove %d" % (i)) for i in range(2)]
+        self.client.reader.feed_data(b'resp 0\0resp')
+        self.client.reader.feed_eof()
+        self.assertEqual(await futures[0], 0)
+        with self.assertRaises(ConnectionError):
+            await asyncio.wait_for(futures[1], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#! /usr/bin/python3
+# reading the control ports of a bundle, scale points and all
+#   python3 -m unittest mod_host.test_catalog
+import os
+import tempfile
+import unittest
+from .catalog import scan_bundle
+
+MANIFEST = '''
+@prefix lv2: <http://lv2plug.in/ns/lv2core#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+<urn:test:gate> a lv2:Plugin ;
+    rdfs:seeAlso <gate.ttl> .
+'''
+
+PLUGIN = '''
+@prefix lv2: <http://lv2plug.in/ns/lv2core#> .
+@prefix doap: <http://usefulinc.com/ns/doap#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+<urn:test:gate> a lv2:Plugin ;
+    doap:name "Gate" ;
+    lv2:port [
+        a lv2:InputPort, lv2:ControlPort ;
+        lv2:index 0 ;
+        lv2:symbol "mode" ;
+        lv2:name "Mode" ;
+        lv2:default 1 ;
+        lv2:minimum 0 ;
+        lv2:maximum 2 ;
+        lv2:scalePoint [ rdfs:label "Off" ; rdf:value 0 ] , [ rdfs:label "Soft [1]." ; rdf:value 1 ]
+    ] , [
+        a lv2:InputPort, lv2:ControlPort ;
+        lv2:index 1 ;
+        lv2:symbol "threshold" ;
+        lv2:name "Threshold" ;
+        lv2:default -40 ;
+        lv2:minimum -80 ;
+        lv2:maximum 0
+    ] , [
+        a lv2:OutputPort, lv2:AudioPort ;
+        lv2:index 2 ;
+        lv2:symbol "out"
+    ] .
+'''
+
+class ScanBundleTest(unittest.TestCase):
+    def test_scale_point_port(self):
+        with tempfile.TemporaryDirectory() as bundle:
+            for name, text in (('manifest.ttl', MANIFEST), ('gate.ttl', PLUGIN)):
+                with open(os.path.join(bundle, name), 'w') as f:
+                    f.write(text)
+
+            plugins = scan_bundle(bundle)
+
+        self.assertEqual(len(plugins), 1)
+        self.assertEqual(plugins[0]['name'], 'Gate')
+        self.assertEqual(plugins[0]['ports'], [
+            {'symbol': 'mode', 'name': 'Mode', 'default': 1.0, 'minimum': 0.0, 'maximum': 2.0},
+            {'symbol': 'threshold', 'name': 'Threshold', 'default': -40.0, 'minimum': -80.0, 'maximum': 0.0},
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
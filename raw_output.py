@@ -0,0 +1,144 @@
+import time
+import queue
+import threading
+import mido
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+
+class RawOutput:
+    '''
+    wraps an output port so note messages can be written as pre-encoded bytes
+    straight to the rtmidi port, without building a mido message for each one
+    '''
+    def __init__(self, port):
+        self.port = port
+        self.encoded = {}
+
+        rt = getattr(port, '_rt', None)
+        if rt is None:
+            # not an rtmidi port, so go the long way through mido
+            self.write = lambda data: port.send(mido.Message.from_bytes(data))
+        else:
+            self.write = rt.send_message
+
+    def __getattr__(self, name):
+        return getattr(self.port, name)
+
+    def send(self, message):
+        self.port.send(message)
+
+    def encode(self, status, data1, data2):
+        key = (status << 14) | (data1 << 7) | data2
+        data = self.encoded.get(key)
+
+        if data is None:
+            data = bytes((status, data1, data2))
+            self.encoded[key] = data
+
+        return data
+
+    def send_bytes(self, status, data1, data2):
+        self.write(self.encode(status, data1, data2))
+
+    def note_on(self, channel, note, velocity=64):
+        self.write(self.encode(NOTE_ON | channel, note, velocity))
+
+    def note_off(self, channel, note, velocity=64):
+        self.write(self.encode(NOTE_OFF | channel, note, velocity))
+
+def wrap(port):
+    return port if isinstance(port, RawOutput) else RawOutput(port)
+
+class StagedPort(RawOutput):
+    '''
+    an output port that collects everything sent during a pass, an engine
+    pass or one input message, into a batch, handing whole batches to a
+    writer thread so a stalled device never holds up the sender. write times
+    go into latency under (path, source, kind) if it is set
+    '''
+    def __init__(self, port, maxsize=64, latency=None, path='write', source=None):
+        RawOutput.__init__(self, port)
+        self.port_write = self.write
+        self.batch = []
+        self.write = self.batch.append
+        self.queue = queue.Queue(maxsize)
+        self.coalesced = 0 # batches joined onto one already waiting
+        self.batches = 0
+        self.messages = 0
+        self.latency = latency
+        self.path = path
+        self.name = getattr(port, 'name', 'output')
+        self.source = self.name if source is None else source
+
+        self.writer = threading.Thread(target=self.drain, daemon=True)
+        self.writer.start()
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    def send(self, message):
+        self.batch.append(message.bytes())
+
+    def panic(self):
+        # all sound off on every channel
+        for channel in range(16):
+            self.batch.append((0xB0 | channel, 120, 0))
+
+    def reset(self):
+        # all notes off and reset all controllers on every channel
+        for channel in range(16):
+            self.batch.append((0xB0 | channel, 123, 0))
+            self.batch.append((0xB0 | channel, 121, 0))
+
+    def flush(self, received=None, kind='batch'):
+        # received is when what the batch answers came in, now if not given
+        if not self.batch: return
+
+        batch = self.batch[:]
+        self.batch.clear()
+        if received is None: received = time.perf_counter()
+
+        try:
+            self.queue.put_nowait((received, kind, batch))
+        except queue.Full:
+            self.coalesce(received, kind, batch)
+
+    def coalesce(self, received, kind, batch):
+        # the writer is behind, so rather than dropping anything, note offs
+        # included, the batch joins the newest one still waiting. the queue's
+        # lock keeps the writer from taking that one meanwhile
+        with self.queue.mutex:
+            if self.queue.queue:
+                self.queue.queue[-1][2].extend(batch)
+                self.coalesced += 1
+                return
+
+        # the writer emptied the queue in between
+        self.queue.put((received, kind, batch))
+
+    def drain(self):
+        while True:
+            item = self.queue.get()
+            if item is None: return
+
+            received, kind, batch = item
+            for data in batch:
+                self.port_write(data)
+
+            if self.latency is not None:
+                self.latency.record(self.path, self.source, kind, received)
+
+            self.batches += 1
+            self.messages += len(batch)
+
+    def close(self):
+        # wait for room rather than dropping what is left
+        if self.batch:
+            self.queue.put((time.perf_counter(), 'batch', self.batch[:]))
+            self.batch.clear()
+
+        self.queue.put(None)
+        self.writer.join()
+        self.port.close()
@@ -1,11 +1,24 @@
+import os
 import time
 import mido
 import sys
 import signal
 import re
+import struct
 from types import FunctionType
 import repeater
 import clock
+import scheduler
+import output_stage
+import input_queue
+import snapshot
+import history
+import ring
+import vector_engine
+import multiprocessing
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from latency import LatencyHistograms
 
 class TransportControl:
     def __init__(self, config, output):
@@ -13,27 +26,95 @@ class TransportControl:
         self.config = config
         self.output = output
         self.loads = {}
+        self.actions = {} # engine side effects of a key being pressed
 
         for key, (off_msg, on_msg, load) in config['inputs'].items():
             d = self.loads.setdefault(load, dict())
             d[on_msg] = (key, True)
             d[off_msg] = (key, False)
 
-    def interpret(self, message):
-        if (message.control == self.config['load_cc']):
-            self.preload = message.value
-        elif(message.control == self.config['control']):
-            key, is_on = self.loads[self.preload][message.value]
+    def set_preload(self, message):
+        self.preload = message.value
+
+    def trigger(self, message):
+        key, is_on = self.loads[self.preload][message.value]
+
+        action = self.actions.get(key)
+        if is_on and action is not None:
+            action()
 
-            key_opt = self.config['output'][key]
-            if (type(key_opt) == FunctionType):
-                key_opt(self.output)
+        key_opt = self.config['output'][key]
+        if (type(key_opt) == FunctionType):
+            key_opt(self.output)
+        else:
+            channel, note = key_opt
+            if is_on:
+                self.output.note_on(channel, note)
             else:
-                channel, note = key_opt
-                self.output.send(mido.Message('note_on' if is_on else 'note_off', channel=channel, note=note))
+                self.output.note_off(channel, note)
+
+    def bindings(self, source):
+        return {
+            (source, 'control_change', self.config['load_cc']): self.set_preload,
+            (source, 'control_change', self.config['control']): self.trigger,
+        }
+
+
+def switch(on, off):
+    def handler(message):
+        if message.value == 127:
+            on()
+        else:
+            off()
+    return handler
 
+def scaled(setter, limit):
+    def handler(message):
+        setter(((message.value-64)/64.0)*limit)
+    return handler
 
-def open_inputs(inpd):
+def compile_dispatch(config, monolith, clk, transport, output):
+    '''
+    turns the config into a table from (source, type, control) to the handler
+    for it, control being None for anything but control changes. messages from
+    a source with no entry go to that source's pass through, if it has one
+    '''
+    def clock_tick(message):
+        clk.tick()
+        if clk.changed:
+            clk.changed = False
+            monolith.set_unit_period(clk.period)
+        output.send(message)
+
+    table = {
+        ('um', 'clock', None): clock_tick,
+        ('keylab-main', 'note_on', None): monolith.noteOn,
+        ('keylab-main', 'note_off', None): monolith.noteOff,
+        ('keylab-main', 'control_change', config['sustainCC']): switch(monolith.sustainOn, monolith.sustainOff),
+        ('keylab-main', 'control_change', config['lockCC']): switch(monolith.lockOn, monolith.lockOff),
+        ('keylab-main', 'control_change', config['loopCC']): switch(monolith.loopOn, monolith.loopOff),
+        ('keylab-main', 'control_change', config['lowQCC']): scaled(monolith.set_lowQ, config['lowQlimit']),
+        ('keylab-main', 'control_change', config['highQCC']): scaled(monolith.set_highQ, config['highQlimit']),
+    }
+    table.update(transport.bindings('keylab-meta'))
+
+    passthrough = {
+        'keylab-main': output.send,
+    }
+
+    def dispatch(source, message):
+        kind = message.type
+        handler = table.get((source, kind, message.control if kind == 'control_change' else None))
+
+        if handler is None:
+            handler = passthrough.get(source)
+        if handler is not None:
+            handler(message)
+
+    return dispatch
+
+def open_inputs(inpd, inbox=None):
+    # with an inbox, every port feeds it from its callback
     available = mido.get_input_names()
     prep = dict()
 
@@ -42,7 +123,8 @@ def open_inputs(inpd):
         matching = tuple(filter(regex.search, available))
 
         if len(matching) == 1:
-            prep[k] = mido.open_input(matching[0])
+            callback = None if inbox is None else inbox.callback(k)
+            prep[k] = mido.open_input(matching[0], callback=callback)
         elif len(matching) > 1:
             raise ValueError("Multiple inputs matching %s"%(name))
         else:
@@ -62,67 +144,121 @@ def open_output(name):
     else:
         raise ValueError("No output midi device matching %s"%(name))
 
+def start_device_processes(config):
+    '''
+    runs the input ports and the output port each in a process of their own,
+    talking to the engine through shared memory rings. returns the inbox and
+    output for the engine, the output also being what gets flushed each pass,
+    and the processes. raises if either cannot open its devices
+    '''
+    context = multiprocessing.get_context('fork')
+    inbox = ring.RingFeed(config['inputs'])
+    output = ring.RingPort()
+
+    inputs_ready, inputs_started = context.Pipe(duplex=False)
+    output_ready, output_started = context.Pipe(duplex=False)
+    processes = (
+        context.Process(target=ring.serve_inputs, name='inputs', daemon=True,
+            args=(inbox, lambda feed: open_inputs(config['inputs'], feed), inputs_started)),
+        context.Process(target=ring.serve_output, name='output', daemon=True,
+            args=(output, lambda: open_output(config['output']), lambda: LatencyHistograms(config.get('latency_dump')), output_started)),
+    )
+
+    try:
+        for process, started in zip(processes, (inputs_started, output_started)):
+            process.start()
+            # only the child keeps a sending end, so its exit reads as EOF
+            started.close()
+
+        for process, ready in zip(processes, (inputs_ready, output_ready)):
+            ring.wait_ready(process, ready)
+    except BaseException:
+        stop_device_processes(processes, inbox, output)
+        raise
+
+    return inbox, output, processes
+
+def stop_device_processes(processes, inbox, output):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+    if inbox.dropped or output.dropped:
+        print("rings dropped %d input and %d output messages" % (inbox.dropped, output.dropped))
+
+    # the shared memory outlives the processes unless it is unlinked
+    inbox.close()
+    output.close()
+
 def main_loop(config):
-    inputs = open_inputs(config['inputs'])
-    output = open_output(config['output'])
+    if config.get('processes'):
+        inbox, output, processes = start_device_processes(config)
+        try:
+            run(config, inbox, output, output)
+        finally:
+            stop_device_processes(processes, inbox, output)
+    else:
+        inbox = input_queue.InputQueue()
+        inputs = open_inputs(config['inputs'], inbox)
+        stage = output_stage.OutputStage()
+        output = stage.add(open_output(config['output']))
+        run(config, inbox, output, stage)
 
-    monolith = repeater.Repeater(output)
+def run(config, inbox, output, stage):
+    # the engine loop, taking input from the inbox and flushing the stage
+    # its output belongs to after every pass
+    sched = scheduler.Scheduler()
+    monolith = repeater.Repeater(output, sched, history.History(config.get('undo_depth', 32)))
+    if config.get('engine') == 'vector':
+        vector_engine.VectorEngine(monolith)
     clk = clock.Clock()
     transport = TransportControl(config['transport'], output)
 
-    def dispatch(source, message):
-        if source == 'um' and message.type == 'clock':
-            clk.tick()
-            monolith.set_unit_period(clk.period)
-            output.send(message)
-
-        if source == 'keylab-main':
-            if message.type == 'control_change':
-                if message.control == config['sustainCC']:
-                    if message.value == 127:
-                        monolith.sustainOn()
-                    else:
-                        monolith.sustainOff()
-                elif message.control == config['lockCC']:
-                    if message.value == 127:
-                        monolith.lockOn()
-                    else:
-                        monolith.lockOff()
-                elif message.control == config['loopCC']:
-                    if message.value == 127:
-                        monolith.loopOn()
-                    else:
-                        monolith.loopOff()
-                elif message.control == config['lowQCC']:
-                    monolith.set_lowQ(((message.value-64)/64.0)*config['lowQlimit'])
-                elif message.control == config['highQCC']:
-                    monolith.set_highQ(((message.value-64)/64.0)*config['highQlimit'])
-                else:
-                    output.send(message)
-            elif message.type == 'note_on':
-                monolith.noteOn(message)
-            elif message.type == 'note_off':
-                monolith.noteOff(message)
-            else:
-                output.send(message)
-        if source == 'keylab-meta':
-            transport.interpret(message)
+    latency = LatencyHistograms(config.get('latency_dump'))
+    budget = config.get('frame_budget', 0.016)
+    output.latency = latency
+
+    path = config.get('snapshot')
+    if path is not None:
+        if os.path.exists(path):
+            try:
+                snapshot.restore(monolith, path)
+            except (OSError, ValueError, struct.error) as err:
+                print("could not restore %s, starting with empty tapes: %s" % (path, err))
+        saver = snapshot.SnapshotWriter(path)
+        transport.actions['save'] = lambda: saver.save(monolith)
+    transport.actions['undo'] = monolith.undo
+
+    dispatch = compile_dispatch(config, monolith, clk, transport, output)
 
     atime = time.time()
-    dt = 0
+    messages = []
 
     while True:
-        for (key, input) in inputs.items():
-            for m in input.iter_pending():
-                dispatch(key, m)
+        woke = time.perf_counter()
 
-        monolith.update(dt)
+        for key, received, m in messages:
+            dispatch(key, m)
+            latency.record('dispatch', key, m.type, received)
 
         atime2 = time.time()
         dt = atime2 - atime
         atime = atime2
 
-        time.sleep(0.016)
+        sched.advance(atime)
+        monolith.update(dt)
+
+        # everything from this pass goes out together on the writer threads
+        stage.flush()
+
+        passed = time.perf_counter()
+        latency.record('pass', 'engine', 'update', woke, passed)
+        if passed - woke > budget:
+            latency.overrun()
+
+        # sleep until the next tape event is due or a message comes in
+        messages = inbox.receive(sched.next_due())
 
 if __name__=='__main__':
 
@@ -146,6 +282,12 @@ if __name__=='__main__':
         'highQCC':71,
         'lowQlimit':4,
         'highQlimit':4,
+        'frame_budget':0.005,
+        'latency_dump':60,
+        'undo_depth':32,
+        'processes':False,
+        'engine':'tape', # or 'vector', which needs numpy
+        'snapshot':os.path.expanduser('~/.cache/pimu/tapes.snap'),
         'transport':{
             'control':47,
             'load_cc':15,
@@ -0,0 +1,104 @@
+#! /usr/bin/python3
+# the per tape update against the vector engine on the same scripted session,
+# checking they send the same bytes at the same times and leave the tapes in
+# the same state, and finding the number of active keys where the vector
+# engine starts to pay
+#   python3 bench_engines.py [frames]
+import sys
+import time
+import mido
+import tape
+import repeater
+import scheduler
+import vector_engine
+from bench_repeater import VirtualClock, FakePort
+
+def session(n_keys, events_per_tape, frames, vector):
+    clock = VirtualClock()
+    tape.now = clock.now
+    port = FakePort(clock)
+
+    sched = scheduler.Scheduler()
+    sched.advance(clock.t)
+    monolith = repeater.Repeater(port, sched)
+    if vector:
+        vector_engine.VectorEngine(monolith)
+
+    unitp = 2.0
+    monolith.set_unit_period(unitp)
+    monolith.loopOn()
+
+    keys = [(i//88, 21 + i%88) for i in range(n_keys)]
+    frame = 0.016
+    cpu = 0
+
+    def step(dt):
+        clock.advance(dt)
+        sched.advance(clock.t)
+        t = time.thread_time()
+        monolith.update(dt)
+        return time.thread_time() - t
+
+    # lay down the loops while playing along
+    notes = max(1, events_per_tape//2)
+    slot = unitp/notes
+    for j in range(notes):
+        for channel, note in keys:
+            monolith.noteOn(mido.Message('note_on', channel=channel, note=note, velocity=100))
+        step(slot*0.4)
+        for channel, note in keys:
+            monolith.noteOff(mido.Message('note_off', channel=channel, note=note))
+        step(slot*0.6)
+
+    sent = len(port._rt.sent)
+    for i in range(frames):
+        if i%150 == 75:
+            unitp = unitp*(1.03 if i%300 == 75 else 1/1.03)
+            monolith.set_unit_period(unitp)
+        if i%97 == 0:
+            monolith.sustainOn() if i%194 == 0 else monolith.sustainOff()
+
+        # hold a key for a while to erase some of its loop, then play a new note
+        channel, note = keys[(i//200)%len(keys)]
+        if i%200 == 10:
+            monolith.noteOn(mido.Message('note_on', channel=channel, note=note, velocity=90))
+        elif i%200 == 40:
+            monolith.noteOff(mido.Message('note_off', channel=channel, note=note))
+
+        cpu += step(frame)
+
+    for ks in monolith.keys.values():
+        ks.tape.sync()
+    tape.now = time.time
+    tapes = sorted((k, [(ev.status, ev.data1, ev.ntime) for ev in ks.tape.events], ks.tape.npos, ks.tape.index)
+        for k, ks in monolith.keys.items())
+    return cpu/frames, port._rt.sent[sent:], tapes
+
+if __name__ == '__main__':
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    print("%5s %6s | %10s %10s %7s | %9s" % ('keys', 'events', 'per tape', 'vector', 'ratio', 'identical'))
+    crossover = {}
+    for events_per_tape in (8, 64):
+        for n_keys in (1, 2, 4, 8, 16, 32, 64, 128, 256):
+            # best of a few runs, the timings being noisy at this scale
+            runs_a = [session(n_keys, events_per_tape, frames, False) for i in range(3)]
+            runs_b = [session(n_keys, events_per_tape, frames, True) for i in range(3)]
+            cpu_a, sent_a, tapes_a = min(runs_a, key=lambda run: run[0])
+            cpu_b, sent_b, tapes_b = min(runs_b, key=lambda run: run[0])
+            same = [(t, bytes(data)) for t, data in sent_a] == [(t, bytes(data)) for t, data in sent_b] and tapes_a == tapes_b
+
+            print("%5d %6d | %8.1fus %8.1fus %7.2f | %9s" % (n_keys, events_per_tape,
+                1e6*cpu_a, 1e6*cpu_b, cpu_a/cpu_b, 'yes' if same else 'NO'))
+            # only where it stays ahead at every larger size, a noisy win at a
+            # small one being no crossover
+            if cpu_b < cpu_a:
+                crossover.setdefault(events_per_tape, n_keys)
+            else:
+                crossover.pop(events_per_tape, None)
+
+    for events_per_tape in (8, 64):
+        if events_per_tape in crossover:
+            print("%d events per tape: vector engine ahead from %d keys" % (events_per_tape, crossover[events_per_tape]))
+        else:
+            print("%d events per tape: vector engine not ahead at the largest size" % (events_per_tape))
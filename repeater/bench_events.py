@@ -0,0 +1,64 @@
+#! /usr/bin/python3
+# compares the footprint of tape events against the old dict based events that
+# held on to the whole mido message
+import gc
+import sys
+import time
+import tracemalloc
+import mido
+from tape import TapeEvent
+
+class DictTapeEvent:
+    def __init__(self, message, tape):
+        self.atime = time.time()
+        self.ntime = (self.atime - tape.clip_start)/tape.period
+        self.partner = None
+        self.message = message
+        self.tape = tape
+        self.standdown = True
+
+class FakeTape:
+    def __init__(self):
+        self.clip_start = time.time()
+        self.period = 2.0
+
+def make_events(cls, count):
+    tape = FakeTape()
+    events = []
+    for i in range(count):
+        on = mido.Message('note_on', note=i%128, velocity=100)
+        off = mido.Message('note_off', note=i%128)
+        events.append(cls(on, tape))
+        events.append(cls(off, tape))
+    return events
+
+def bytes_per_thousand(cls, count):
+    gc.collect()
+    tracemalloc.start()
+    events = make_events(cls, count//2)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return 1000*size/len(events), events
+
+def gc_pause(events, rounds=20):
+    best = None
+    for i in range(rounds):
+        t = time.perf_counter()
+        gc.collect()
+        dt = time.perf_counter() - t
+        best = dt if best is None else min(best, dt)
+    return best
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    results = {}
+    for cls in (DictTapeEvent, TapeEvent):
+        per_k, events = bytes_per_thousand(cls, count)
+        pause = gc_pause(events)
+        results[cls.__name__] = (per_k, pause)
+        print("%-14s %9.1f KiB per 1000 events, full gc %7.2f ms with %d live" % (cls.__name__, per_k/1024, pause*1000, len(events)))
+        del events
+
+    (old_k, old_p), (new_k, new_p) = results['DictTapeEvent'], results['TapeEvent']
+    print("saved %.1f KiB per 1000 events (%.0f%%), gc pause down %.0f%%" % ((old_k - new_k)/1024, 100*(1 - new_k/old_k), 100*(1 - new_p/old_p)))
@@ -0,0 +1,158 @@
+#! /usr/bin/python3
+# end to end latency and cpu of the engine loop with device i/o on threads in
+# one process against device processes talking through shared memory rings.
+# the engine passes input straight through while keeping a number of loops
+# playing, the devices are a paced feeder and a port that notes write times
+#   python3 bench_processes.py [seconds] [rate] [keys]
+import os
+import sys
+import time
+import threading
+import multiprocessing
+import mido
+import tape
+import repeater
+import scheduler
+import input_queue
+import output_stage
+import ring
+
+IDS = 128*127
+
+def message_id(i):
+    return (i//127)%128, 1 + i%127
+
+class RecordingRtMidi:
+    def __init__(self, written):
+        self.written = written
+
+    def send_message(self, data):
+        # only the passed through notes on channel 1 are timed, not the loops
+        if data[0] == 0x90:
+            self.written[data[1]*127 + data[2] - 1] = time.perf_counter()
+
+class RecordingPort:
+    def __init__(self, written):
+        self._rt = RecordingRtMidi(written)
+        self.name = 'recorder'
+
+    def close(self):
+        pass
+
+def feed(callback, rate, seconds, sent):
+    count = min(int(rate*seconds), IDS)
+    start = time.perf_counter()
+    for i in range(count):
+        wait = start + i/rate - time.perf_counter()
+        if wait > 0: time.sleep(wait)
+
+        note, velocity = message_id(i)
+        sent[i] = time.perf_counter()
+        callback(mido.Message('note_on', note=note, velocity=velocity))
+
+def load_loops(monolith, keys, events):
+    # loops on channel 2 laid straight onto the tapes
+    for k in range(keys):
+        ks = monolith.getKeyState(mido.Message('note_on', channel=1, note=24 + k%96))
+        evs = []
+        for j in range(events//2):
+            on = tape.TapeEvent.restore(0x91, ks.note, 100, j/(events//2), 0)
+            off = tape.TapeEvent.restore(0x81, ks.note, 0, (j + 0.5)/(events//2), 0)
+            on.pair(off)
+            evs.extend((on, off))
+        ks.tape.load(evs, 0)
+
+def engine(inbox, output, flush, keys, seconds):
+    sched = scheduler.Scheduler()
+    monolith = repeater.Repeater(output, sched)
+    monolith.set_unit_period(0.5)
+    monolith.loopOn()
+    load_loops(monolith, keys, 16)
+
+    end = time.time() + seconds
+    atime = time.time()
+    messages = []
+    cpu = time.process_time()
+
+    while atime < end:
+        for key, received, m in messages:
+            output.send(m)
+
+        atime2 = time.time()
+        dt = atime2 - atime
+        atime = atime2
+
+        sched.advance(atime)
+        monolith.update(dt)
+        flush()
+
+        due = sched.next_due()
+        messages = inbox.receive(end if due is None else min(due, end))
+
+    return time.process_time() - cpu
+
+def latencies(sent, written):
+    return sorted(written[i] - sent[i] for i in range(IDS) if sent[i] and written[i])
+
+def threaded(rate, seconds, keys):
+    sent = [0.0]*IDS
+    written = [0.0]*IDS
+    inbox = input_queue.InputQueue()
+    stage = output_stage.OutputStage()
+    output = stage.add(RecordingPort(written))
+
+    feeder = threading.Thread(target=feed, args=(inbox.callback('keys'), rate, seconds, sent), daemon=True)
+    wall = time.perf_counter()
+    feeder.start()
+    engine_cpu = engine(inbox, output, stage.flush, keys, seconds)
+    wall = time.perf_counter() - wall
+    stage.close()
+
+    # the feeder and writer threads share the engine's process and its gil
+    return latencies(sent, written), engine_cpu, engine_cpu, wall
+
+def processes(rate, seconds, keys):
+    context = multiprocessing.get_context('fork')
+    sent = context.Array('d', IDS, lock=False)
+    written = context.Array('d', IDS, lock=False)
+    inbox = ring.RingFeed(['keys'])
+    output = ring.RingPort()
+
+    feeder = context.Process(target=feed, args=(inbox.callback('keys'), rate, seconds, sent), daemon=True)
+    writer = context.Process(target=ring.serve_output, args=(output, lambda: RecordingPort(written)), daemon=True)
+    writer.start()
+    children = os.times()
+
+    wall = time.perf_counter()
+    feeder.start()
+    engine_cpu = engine(inbox, output, output.flush, keys, seconds)
+    wall = time.perf_counter() - wall
+
+    time.sleep(0.05) # let the writer catch up before stopping it
+    feeder.join()
+    writer.terminate()
+    writer.join()
+    after = os.times()
+    child_cpu = (after.children_user + after.children_system) - (children.children_user + children.children_system)
+
+    result = latencies(sent, written)
+    inbox.close()
+    output.close()
+    return result, engine_cpu, engine_cpu + child_cpu, wall
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q*len(values)))] if values else float('nan')
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    print("%-9s %5s %7s | %8s %8s %8s | %10s %10s %9s" % ('mode', 'keys', 'msg/s',
+        'n', 'p50', 'p99', 'engine cpu', 'total cpu', 'headroom'))
+
+    for keys in ((int(sys.argv[3]),) if len(sys.argv) > 3 else (0, 32, 88)):
+        for name, run in (('threads', threaded), ('processes', processes)):
+            lat, engine_cpu, total_cpu, wall = run(rate, seconds, keys)
+            print("%-9s %5d %7.0f | %8d %6.3fms %6.3fms | %9.1f%% %9.1f%% %8.1f%%" % (name, keys, rate,
+                len(lat), 1000*percentile(lat, 0.5), 1000*percentile(lat, 0.99),
+                100*engine_cpu/wall, 100*total_cpu/wall, 100*(1 - engine_cpu/wall)))
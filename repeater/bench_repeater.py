@@ -0,0 +1,157 @@
+#! /usr/bin/python3
+# synthetic workloads through Repeater on a virtual clock, sweeping the number
+# of looping keys, events per tape and tempo changes
+#   python3 bench_repeater.py [frames]
+import gc
+import sys
+import time
+import tracemalloc
+import mido
+import tape
+import repeater
+import scheduler
+
+class VirtualClock:
+    def __init__(self, start=1000.0):
+        self.t = start
+
+    def now(self):
+        return self.t
+
+    def advance(self, dt):
+        self.t += dt
+
+class FakeRtMidi:
+    def __init__(self, clock):
+        self.clock = clock
+        self.sent = []
+
+    def send_message(self, data):
+        self.sent.append((self.clock.t, data))
+
+class FakePort:
+    '''
+    output with an rtmidi handle so the raw byte path is the one measured
+    '''
+    def __init__(self, clock):
+        self._rt = FakeRtMidi(clock)
+
+    def send(self, message):
+        self._rt.send_message(message.bytes())
+
+    def reset(self):
+        pass
+
+def record(monolith, clock, keys, events_per_tape, unitp, frame):
+    # lay down evenly spaced notes on every key, updating as the engine would
+    notes = max(1, events_per_tape//2)
+    slot = unitp/notes
+
+    for j in range(notes):
+        for note in keys:
+            monolith.noteOn(mido.Message('note_on', note=note, velocity=100))
+        clock.advance(slot*0.4)
+        monolith.update(slot*0.4)
+
+        for note in keys:
+            monolith.noteOff(mido.Message('note_off', note=note))
+        clock.advance(slot*0.6)
+        monolith.update(slot*0.6)
+
+def timing_errors(monolith, sent):
+    # how far from the moment its tape cursor crossed each event it was sent
+    errors = []
+    for t, data in sent:
+        ks = monolith.keys.get((data[0] & 0x0F, data[1]))
+        if ks is None: continue
+
+        tp = ks.tape
+        phase = ((t - tp.clip_start)/tp.period)%1.0
+        off = [abs(((phase - ev.ntime + 0.5)%1.0) - 0.5)*tp.period for ev in tp.events if ev.status == data[0]]
+        if off:
+            errors.append(min(off))
+    return errors
+
+def run(n_keys, events_per_tape, tempo_changes, frames, scheduled):
+    clock = VirtualClock()
+    tape.now = clock.now
+    port = FakePort(clock)
+
+    sched = scheduler.Scheduler()
+    sched.advance(clock.t)
+    monolith = repeater.Repeater(port, sched)
+    unitp = 2.0
+    monolith.set_unit_period(unitp)
+    monolith.loopOn()
+
+    keys = [36 + (i%88) for i in range(n_keys)]
+    frame = 0.016
+    record(monolith, clock, keys, events_per_tape, unitp, frame)
+    port._rt.sent = []
+
+    change_every = frames//(tempo_changes + 1) if tempo_changes else frames + 1
+    cpu = 0
+    transient = 0
+    errors = []
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+
+    for i in range(frames):
+        if i and i%change_every == 0:
+            unitp = unitp*(1.02 if i%(2*change_every) else 0.98)
+            monolith.set_unit_period(unitp)
+        if i%97 == 0:
+            monolith.sustainOn() if i%194 == 0 else monolith.sustainOff()
+        if i%89 == 0:
+            monolith.lockOn() if i%178 == 0 else monolith.lockOff()
+
+        # either a fixed frame or straight to the next due event, allowing
+        # for the loop itself taking a little time
+        due = sched.next_due()
+        dt = frame if due is None or not scheduled else min(frame, max(due - clock.t, 1e-5))
+        clock.advance(dt)
+        sched.advance(clock.t)
+
+        t = time.thread_time()
+        monolith.update(dt)
+        cpu += time.thread_time() - t
+
+        errors.extend(timing_errors(monolith, port._rt.sent))
+        port._rt.sent = []
+
+    retained = (sys.getallocatedblocks() - blocks)/frames
+
+    # transient allocation is measured on a separate pass as tracing is slow
+    tracemalloc.start()
+    for i in range(min(frames, 200)):
+        clock.advance(frame)
+        sched.advance(clock.t)
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        monolith.update(frame)
+        transient += tracemalloc.get_traced_memory()[1] - before
+        port._rt.sent = []
+    tracemalloc.stop()
+    transient = transient/min(frames, 200)
+
+    tape.now = time.time
+
+    errors.sort()
+    p50 = errors[len(errors)//2] if errors else 0
+    p99 = errors[min(len(errors) - 1, int(0.99*len(errors)))] if errors else 0
+    return cpu/frames, len(errors), p50, p99, transient, retained
+
+if __name__ == '__main__':
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    print("%5s %6s %6s %5s | %10s %7s %9s %9s %10s %9s" % ('keys', 'events', 'tempo', 'mode',
+        'us/update', 'emitted', 'err p50', 'err p99', 'B/update', 'blk/frame'))
+
+    for scheduled in (False, True):
+        for n_keys in (1, 8, 32, 88):
+            for events_per_tape in (4, 32, 128):
+                for tempo_changes in (0, 20):
+                    cpu, emitted, p50, p99, transient, retained = run(n_keys, events_per_tape, tempo_changes, frames, scheduled)
+                    print("%5d %6d %6d %5s | %10.1f %7d %7.2fms %7.2fms %10.0f %9.2f" % (
+                        n_keys, events_per_tape, tempo_changes, 'sched' if scheduled else 'fixed',
+                        1e6*cpu, emitted, 1000*p50, 1000*p99, transient, retained))
@@ -1,18 +1,114 @@
 import time
+from collections import deque
+from math import sqrt
 
 class Clock:
-    def __init__(self):
-        self.clock_time = time.time()
+    '''
+    tracks tempo from midi clock ticks, fitting a line through the ticks of a
+    window so that usb jitter does not leak into the published period
+    '''
+    def __init__(self, window=48, tolerance=0.01, timeout=0.5, relock=4, settle=12, resolution=0.001):
+        self.clock_time = None
+        self.count = 0 # ticks counted, those missed included
+        self.ticks = deque(maxlen=window + 1) # (count, time) of the window's ticks
+        self.interval = 1/24.0
+        self.jitter = 0 # of the ticks about the line through them
+        self.centre = (0, 0) # mean (count, time) of the window
+        self.spread = 0 # sum of squares of the counts about the mean
         self.period = 1
-        self.oldp = 1
         self.changed = False
 
-    def tick(self):
-        nct = time.time()
-        dct = nct - self.clock_time
-        self.clock_time = nct
-        self.period = 24*dct
+        self.tolerance = tolerance # relative change in period before it is published
+        self.resolution = resolution # relative change too small to publish however steady the clock
+        self.timeout = timeout # a longer gap than this means the clock stopped
+        self.relock = relock # consecutive outliers taken as a real tempo change
+        self.settle = settle # ticks in the window before anything is published
+        self.outliers = 0
+        self.dropped = 0
+        self.duplicated = 0
 
-        if (abs(self.oldp - self.period)>0.01):
+    @property
+    def bpm(self):
+        return 60.0/self.period
+
+    def reset(self):
+        self.ticks.clear()
+        self.outliers = 0
+
+    def fit(self):
+        # least squares line through the (count, time) of the window, whose
+        # slope is the interval. every tick pulls on it, so one coming early or
+        # late hardly moves it, and it says where each tick should have come
+        ticks = self.ticks
+        n = len(ticks)
+        mc = sum(c for c, t in ticks)/n
+        mt = sum(t for c, t in ticks)/n
+        spread = sum((c - mc)**2 for c, t in ticks)
+
+        self.interval = sum((c - mc)*(t - mt) for c, t in ticks)/spread
+        self.jitter = sqrt(sum((t - mt - self.interval*(c - mc))**2 for c, t in ticks)/n)
+        self.centre = (mc, mt)
+        self.spread = spread
+
+    def tick(self, now=None):
+        if now is None: now = time.monotonic()
+
+        if self.clock_time is None:
+            self.clock_time = now
+            return
+
+        dct = now - self.clock_time
+
+        if dct > self.timeout:
+            #clock was stopped, start estimating again from here
+            self.clock_time = now
+            self.reset()
+            return
+
+        # how many ticks on from the last this one is. going by where the line
+        # puts the last rather than when it came takes its jitter out, but a
+        # tick only counts as doubled or missed when the gap agrees, a tick
+        # off the line with an ordinary gap being the tempo moving
+        missed = 1
+        if len(self.ticks) > 1:
+            mc, mt = self.centre
+            ratio = (now - mt)/self.interval - (self.count - mc)
+            gap = dct/self.interval
+
+            if ratio < 0.5 or ratio > 1.5:
+                self.outliers += 1
+
+                if self.outliers >= self.relock:
+                    # persistently off, the tempo has jumped
+                    self.reset()
+                elif ratio < 0.5 and gap < 0.5:
+                    # a duplicated tick, keep measuring from the one before
+                    self.duplicated += 1
+                    return
+                elif ratio > 1.5 and gap > 1.5 and abs(ratio - round(ratio)) < 0.3:
+                    # dropped ticks, counted in so the gap is shared between them
+                    missed = round(ratio)
+                    self.dropped += missed - 1
+            else:
+                self.outliers = 0
+
+        if not self.ticks:
+            self.ticks.append((self.count, self.clock_time))
+        self.count += missed
+        self.clock_time = now
+        self.ticks.append((self.count, now))
+        self.fit()
+
+        if len(self.ticks) <= self.settle: return
+
+        # the slope is off by about the jitter over the root of the spread, and
+        # the published period is itself one such estimate, hence the sqrt(2).
+        # changes beyond tolerance are always published, smaller ones once
+        # they stand out from that noise, and none below the resolution, which
+        # a perfectly steady clock would otherwise trip with float rounding
+        period = 24*self.interval
+        noise = 4*sqrt(2)*24*self.jitter/sqrt(self.spread)
+        threshold = min(self.tolerance*self.period, max(noise, self.resolution*self.period))
+        if (abs(period - self.period) > threshold):
+            self.period = period
             self.changed = True
-            self.oldp = self.period
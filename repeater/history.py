@@ -0,0 +1,72 @@
+from collections import deque
+
+# the kinds of edit a tape records
+INSERT = 0  # event placed, nothing else
+ERASE = 1   # event taken out, with the partner it was paired to
+REPLACE = 2 # whole contents swapped, old and new (events, ntimes)
+
+class History:
+    '''
+    undo and redo across every tape as a log of the edits made to them rather
+    than copies of their contents. each edit costs one tuple, events are
+    shared between the tapes and the log, and replaced contents are kept by
+    reference. edits are grouped into gestures by mark, depth of them kept
+    '''
+    def __init__(self, depth=32):
+        self.undos = deque(maxlen=depth)
+        self.redos = []
+        self.group = []
+
+    def record(self, tape, op, a, b=None):
+        self.group.append((tape, op, a, b))
+        if self.redos:
+            self.redos.clear() # a new edit forks from what was undone
+
+    def mark(self):
+        # whatever was edited since the last mark becomes one undo step
+        if self.group:
+            self.undos.append(self.group)
+            self.group = []
+
+    def clear(self):
+        # forget everything, the tapes as they are being where undo stops
+        self.undos.clear()
+        self.redos.clear()
+        self.group = []
+
+    def undo(self):
+        # returns the tapes that changed
+        self.mark()
+        if not self.undos: return ()
+
+        group = self.undos.pop()
+        for tape, op, a, b in reversed(group):
+            if op == INSERT:
+                tape.remove(a)
+            elif op == ERASE:
+                tape.place(a)
+                if b is not None:
+                    a.pair(b)
+            else:
+                tape.replace(*a)
+
+        self.redos.append(group)
+        return set(entry[0] for entry in group)
+
+    def redo(self):
+        self.mark()
+        if not self.redos: return ()
+
+        group = self.redos.pop()
+        for tape, op, a, b in group:
+            if op == INSERT:
+                tape.place(a)
+            elif op == ERASE:
+                tape.remove(a)
+                if b is not None and a.partner is b:
+                    a.unpair()
+            else:
+                tape.replace(*b)
+
+        self.undos.append(group)
+        return set(entry[0] for entry in group)
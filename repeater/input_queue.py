@@ -0,0 +1,38 @@
+import time
+import queue
+
+class InputQueue:
+    '''
+    one queue fed by the callbacks of every input port, which the engine
+    blocks on until a message arrives or its next deadline comes round
+    '''
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+
+    def callback(self, source):
+        put = self.queue.put
+
+        def received(message):
+            put((source, time.perf_counter(), message))
+        return received
+
+    def receive(self, deadline=None):
+        # returns every (source, timestamp, message) waiting, once there are any
+        # or the deadline passes
+        get = self.queue.get
+
+        try:
+            if deadline is None:
+                first = get()
+            else:
+                timeout = deadline - time.time()
+                first = get(timeout=timeout) if timeout > 0 else get(block=False)
+        except queue.Empty:
+            return []
+
+        messages = [first]
+        try:
+            while True:
+                messages.append(get(block=False))
+        except queue.Empty:
+            return messages
@@ -1,25 +1,30 @@
 from math import floor
-import mido
 from tape import Tape, TapeEvent
 
+def quantize_table(qlow, qhigh):
+    # period multiplier for each of the 128 notes
+    return tuple(2**floor(((note - 60)/60.0)*(qhigh-qlow) + qlow) for note in range(128))
+
 class KeyState:
     def __init__(self, message, parent):
         self.note = message.note
         self.channel = message.channel
         self.held = False
         self.on = False
-        self.tape = Tape(self)
-        self.set_quantized_period(parent.lowq, parent.highq, parent.unitp)
         self.parent = parent
+        self.tape = Tape(self)
+        self.set_quantized_period(parent.quantization(), parent.unitp)
         self.current = message
 
-    def set_quantized_period(self, qlow, qhigh, unit):
-        p = unit*2**floor(((self.note - 60)/60.0)*(qhigh-qlow) + qlow)
-        self.tape.set_period(p)
+    def set_quantized_period(self, table, unit):
+        p = unit*table[self.note]
+        if p != self.tape.period:
+            self.tape.set_period(p)
 
     def noteOn(self, message):
         self.held = True
         parent = self.parent
+        parent.track(self)
 
         if parent.loop:
             if self.on:
@@ -30,11 +35,14 @@ class KeyState:
 
         self.parent.output.send(message)
         self.on = True
+        # the event is placed by the cursor, which a vector engine may hold
+        self.tape.sync()
         self.current = TapeEvent(message, self.tape)
 
     def turnOff(self):
         self.on = False
-        self.parent.output.send(mido.Message('note_off', note=self.note, channel=self.channel))
+        self.parent.output.note_off(self.channel, self.note)
+        self.parent.track(self)
 
     def noteOff(self, message):
         self.held = False
@@ -42,6 +50,7 @@ class KeyState:
 
         if parent.loop:
             # insert note into tape
+            self.tape.sync()
             self.tape.add_note(self.current, TapeEvent(message, self.tape))
             parent.output.send(message)
             self.on = False
@@ -52,6 +61,7 @@ class KeyState:
             self.on = False
 
         self.current = None
+        parent.track(self)
 
     def update(self, dt):
         self.tape.update(dt)
@@ -0,0 +1,34 @@
+import os
+import sys
+
+# the staged port is shared with the scripts at the top of the repo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from raw_output import StagedPort
+
+class OutputStage:
+    '''
+    the set of staged ports the engine writes to, flushed together at the end
+    of each pass
+    '''
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.ports = []
+
+    def add(self, port):
+        staged = StagedPort(port, self.maxsize)
+        self.ports.append(staged)
+        return staged
+
+    def flush(self):
+        for port in self.ports:
+            port.flush()
+
+    def depth(self):
+        return sum(port.depth for port in self.ports)
+
+    def coalesced(self):
+        return sum(port.coalesced for port in self.ports)
+
+    def close(self):
+        for port in self.ports:
+            port.close()
@@ -1,9 +1,22 @@
-from key_state import KeyState
+import os
+import sys
+from key_state import KeyState, quantize_table
+from history import History
+
+# the raw output is shared with the scripts at the top of the repo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import raw_output
 
 class Repeater:
-    def __init__(self, output):
+    def __init__(self, output, scheduler=None, history=None):
         self.keys = dict()
-        self.output = output
+        # keys that are held, sounding or have a tape to play, as an ordered
+        # dict so they are always visited in the order they became active
+        self.active = dict()
+        self.output = raw_output.wrap(output)
+        self.scheduler = scheduler
+        self.history = History() if history is None else history
+        self.engine = None # updates the tapes in place of update, if set
         self.sustain = False
         self.lock = False
         self.loop = False
@@ -11,6 +24,7 @@ class Repeater:
         self.highq = 0
         self.lowq = 0
         self.unitp = 1
+        self.qtable = (None, None) # (lowq, highq) it was built for, table
 
     def getKeyState(self, message):
         key = (message.channel, message.note)
@@ -28,6 +42,8 @@ class Repeater:
         return filter(lambda ks: ks.on == is_on, self.keys.values())
 
     def noteOn(self, message):
+        # each press starts a new undo step
+        self.history.mark()
         keystate = self.getKeyState(message)
         keystate.noteOn(message)
 
@@ -63,32 +79,87 @@ class Repeater:
         self.turnOffUnheld()
 
     def set_lowQ(self, lowq):
-        self.lowq = lowq
-        self.reset_periods()
+        if lowq != self.lowq:
+            self.lowq = lowq
+            self.reset_periods()
 
     def set_highQ(self, highq):
-        self.highq = highq
-        self.reset_periods()
+        if highq != self.highq:
+            self.highq = highq
+            self.reset_periods()
 
     def set_unit_period(self, period):
-        self.unitp = period
-        self.reset_periods()
+        if period != self.unitp:
+            self.unitp = period
+            self.reset_periods()
+
+    def quantization(self):
+        # the knobs sweep through a continuum of settings, only the current
+        # table is worth keeping
+        key = (self.lowq, self.highq)
+        built, table = self.qtable
+
+        if built != key:
+            table = quantize_table(self.lowq, self.highq)
+            self.qtable = (key, table)
+
+        return table
+
+    def track(self, keystate):
+        if keystate.held or keystate.on or keystate.tape.events:
+            if keystate not in self.active:
+                # idle tapes are not updated so bring the cursor up to date
+                keystate.tape.resync()
+                self.active[keystate] = None
+                if self.engine is not None:
+                    self.engine.regroup()
+        elif keystate in self.active:
+            del self.active[keystate]
+            if self.engine is not None:
+                self.engine.regroup()
+
+    def schedule(self, tape):
+        # tapes call this on any change but their cursor moving in update
+        if self.scheduler is not None:
+            self.scheduler.reschedule(tape)
+        if self.engine is not None:
+            self.engine.touch(tape)
 
     def reset_periods(self):
+        table = self.quantization()
         for ks in self.keys.values():
-            ks.set_quantized_period(self.lowq, self.highq, self.unitp)
+            ks.set_quantized_period(table, self.unitp)
 
     def clearAllTapes(self):
-        for ks in self.keys.values():
+        self.history.mark()
+        for ks in tuple(self.active):
             ks.tape.clear()
+        self.history.mark()
+
+    def undo(self):
+        self.settle(self.history.undo())
+
+    def redo(self):
+        self.settle(self.history.redo())
+
+    def settle(self, tapes):
+        # notes left sounding by an off event that is no longer on the tape
+        for tp in tapes:
+            ks = tp.keystate
+            if ks.on and not ks.held:
+                ks.turnOff()
 
     def turnOffUnheld(self):
-        for ks in self.keys.values():
+        for ks in tuple(self.active):
             if ks.on and not ks.held:
                 ks.turnOff()
 
     def update(self, dt):
-        for keystate in self.keys.values():
+        if self.engine is not None:
+            self.engine.update(dt)
+            return
+
+        for keystate in tuple(self.active):
             keystate.update(dt)
 
     def panic(self):
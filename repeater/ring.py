@@ -0,0 +1,266 @@
+import os
+import sys
+import time
+import select
+import signal
+import struct
+import mido
+from multiprocessing import shared_memory
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from raw_output import RawOutput
+
+# head (next slot written), tail (next slot read) and the messages dropped
+# for want of room, only ever counting up. each is written by one side alone,
+# which is what keeps the ring lock free
+COUNTERS = struct.Struct('<QQQ')
+COUNTER = struct.Struct('<Q')
+HEAD, TAIL, DROPPED = 0, COUNTER.size, 2*COUNTER.size
+# source id, timestamp, length and the first three bytes of one message. the
+# rest of a longer one, sysex, runs on through the slots after it
+SLOT = struct.Struct('<HdH3sx')
+
+class Ring:
+    '''
+    single producer, single consumer ring of timestamped raw midi in shared
+    memory. made before the device processes are forked so both sides map
+    the same block
+    '''
+    def __init__(self, slots=1024):
+        self.slots = slots
+        self.shm = shared_memory.SharedMemory(create=True, size=COUNTERS.size + slots*SLOT.size)
+        self.buf = self.shm.buf
+        COUNTERS.pack_into(self.buf, 0, 0, 0, 0)
+
+    @property
+    def dropped(self):
+        # kept in the shared block, so the consumer sees the producer's count
+        return COUNTER.unpack_from(self.buf, DROPPED)[0]
+
+    def push(self, source, timestamp, data):
+        # returns whether the ring was empty, and the consumer may be asleep
+        buf = self.buf
+        head, tail, dropped = COUNTERS.unpack_from(buf, 0)
+        length = len(data)
+        used = 1 if length <= 3 else 1 + (length - 3 + SLOT.size - 1)//SLOT.size
+        if head - tail + used > self.slots:
+            COUNTER.pack_into(buf, DROPPED, dropped + 1)
+            return False
+
+        slots = self.slots
+        SLOT.pack_into(buf, COUNTERS.size + (head%slots)*SLOT.size, source, timestamp, length, bytes(data[:3]))
+        for i in range(1, used):
+            at = COUNTERS.size + ((head + i)%slots)*SLOT.size
+            chunk = bytes(data[3 + (i - 1)*SLOT.size:3 + i*SLOT.size])
+            buf[at:at + len(chunk)] = chunk
+
+        # the slots are complete before the head moves past them
+        COUNTER.pack_into(buf, HEAD, head + used)
+        return head == tail
+
+    def pop(self):
+        # every (source, timestamp, bytes) waiting
+        buf = self.buf
+        head, tail, dropped = COUNTERS.unpack_from(buf, 0)
+        if head == tail: return ()
+
+        unpack = SLOT.unpack_from
+        slots = self.slots
+        records = []
+        i = tail
+        while i < head:
+            source, timestamp, length, data = unpack(buf, COUNTERS.size + (i%slots)*SLOT.size)
+            i += 1
+            if length > 3:
+                parts = [data]
+                for rest in range(length - 3, 0, -SLOT.size):
+                    at = COUNTERS.size + (i%slots)*SLOT.size
+                    parts.append(bytes(buf[at:at + min(rest, SLOT.size)]))
+                    i += 1
+                data = b''.join(parts)
+            records.append((source, timestamp, data[:length]))
+
+        COUNTER.pack_into(buf, TAIL, head)
+        return records
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+class Doorbell:
+    '''
+    a pipe the producers write a byte to when they put something in an empty
+    ring, so the consumer can sleep in select rather than poll
+    '''
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+        os.set_blocking(self.write_fd, False)
+
+    def ring(self):
+        try:
+            os.write(self.write_fd, b'\0')
+        except BlockingIOError:
+            pass # already plenty to wake up to
+
+    def wait(self, timeout=None):
+        select.select([self.read_fd], [], [], timeout)
+        try:
+            os.read(self.read_fd, 4096)
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+class RingFeed:
+    '''
+    one ring per input source with a shared doorbell. the input process uses
+    callback, as it would with an InputQueue, and the engine receive
+    '''
+    def __init__(self, sources, slots=1024):
+        self.sources = tuple(sources)
+        self.ids = {source: i for i, source in enumerate(self.sources)}
+        self.rings = [Ring(slots) for source in self.sources]
+        self.bell = Doorbell()
+
+    def callback(self, source):
+        source_id = self.ids[source]
+        push = self.rings[source_id].push
+        ring = self.bell.ring
+        clock = time.perf_counter
+
+        def received(message):
+            if push(source_id, clock(), message.bytes()):
+                ring()
+        return received
+
+    def poll(self):
+        messages = []
+        parse = mido.Message.from_bytes
+        for ring in self.rings:
+            for source_id, timestamp, data in ring.pop():
+                messages.append((self.sources[source_id], timestamp, parse(data)))
+        return messages
+
+    @property
+    def dropped(self):
+        return sum(ring.dropped for ring in self.rings)
+
+    def receive(self, deadline=None):
+        # the same as InputQueue.receive, deadline in time.time
+        messages = self.poll()
+        if messages: return messages
+
+        timeout = None if deadline is None else max(0, deadline - time.time())
+        self.bell.wait(timeout)
+        return self.poll()
+
+    def close(self):
+        for ring in self.rings:
+            ring.close()
+            ring.unlink()
+        self.bell.close()
+
+class RingPort(RawOutput):
+    '''
+    the engine side of an output running in another process. everything is
+    written straight into the ring and the output process woken once a pass,
+    on flush
+    '''
+    def __init__(self, slots=1024, name='output'):
+        RawOutput.__init__(self, None)
+        self.ring = Ring(slots)
+        self.bell = Doorbell()
+        self.name = name
+        self.pending = False
+        self.latency = None # unused here, the output process keeps its own
+
+        push = self.ring.push
+        clock = time.perf_counter
+        def write(data):
+            push(0, clock(), data)
+            self.pending = True
+        self.write = write
+
+    @property
+    def dropped(self):
+        return self.ring.dropped
+
+    def send(self, message):
+        self.write(message.bytes())
+
+    def panic(self):
+        # all sound off on every channel
+        for channel in range(16):
+            self.write(bytes((0xB0 | channel, 120, 0)))
+
+    def reset(self):
+        # all notes off and reset all controllers on every channel
+        for channel in range(16):
+            self.write(bytes((0xB0 | channel, 123, 0)))
+            self.write(bytes((0xB0 | channel, 121, 0)))
+
+    def flush(self):
+        if self.pending:
+            self.pending = False
+            self.bell.ring()
+
+    def close(self):
+        self.ring.close()
+        self.ring.unlink()
+        self.bell.close()
+
+def open_device(opener, ready):
+    # a device process that cannot open its ports tells the engine why and
+    # exits, rather than leave it waiting on a ring nothing will fill
+    try:
+        device = opener()
+    except Exception as err:
+        if ready is not None:
+            ready.send("%s: %s" % (type(err).__name__, err))
+        raise SystemExit(1)
+
+    if ready is not None:
+        ready.send(None)
+        ready.close()
+    return device
+
+def wait_ready(process, ready, timeout=10):
+    # raises what a device process failed to start with
+    try:
+        error = ready.recv() if ready.poll(timeout) else "no word after %gs" % (timeout)
+    except EOFError:
+        error = "exited with code %s" % (process.exitcode)
+    ready.close()
+
+    if error is not None:
+        raise RuntimeError("%s could not start, %s" % (process.name, error))
+
+def serve_inputs(feed, open_inputs, ready=None):
+    # body of the input process, the port callbacks do all the work
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ports = open_device(lambda: open_inputs(feed), ready)
+    while True:
+        signal.pause()
+
+def serve_output(output, open_port, make_latency=None, ready=None):
+    # body of the output process, writing whatever the engine rang about
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    port = open_device(open_port, ready)
+    latency = make_latency() if make_latency is not None else None
+    rt = getattr(port, '_rt', None)
+    write = rt.send_message if rt is not None else lambda data: port.send(mido.Message.from_bytes(data))
+
+    ring = output.ring
+    wait = output.bell.wait
+    while True:
+        wait()
+        for source_id, timestamp, data in ring.pop():
+            write(data)
+            if latency is not None:
+                latency.record('write', output.name, 'ring', timestamp)
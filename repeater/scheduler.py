@@ -0,0 +1,57 @@
+import time
+import heapq
+
+class Scheduler:
+    '''
+    keeps the time at which each tape next needs attention in a single heap so
+    the engine loop can sleep right up until the earliest one
+    '''
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+        self.seq = 0
+        self.stamp = time.time() # time of the last update pass
+
+    def advance(self, now):
+        self.stamp = now
+
+    def due_time(self, tape):
+        next = tape.next_event()
+        if next is None: return None
+
+        # fraction of the loop until the event comes round from the cursor
+        phase = (next.ntime - tape.npos)%1.0
+        if phase == 0: phase = 1.0
+
+        return self.stamp + phase*tape.period
+
+    def reschedule(self, tape):
+        due = self.due_time(tape)
+
+        if due is None:
+            self.deadlines.pop(tape, None)
+        elif self.deadlines.get(tape) != due:
+            self.deadlines[tape] = due
+            self.seq += 1
+            heapq.heappush(self.heap, (due, self.seq, tape))
+
+    def next_due(self):
+        heap = self.heap
+
+        while heap:
+            due, _, tape = heap[0]
+            if self.deadlines.get(tape) != due:
+                heapq.heappop(heap) # superseded entry
+            elif due <= self.stamp:
+                # passed without being played, work out when it next comes round
+                heapq.heappop(heap)
+                del self.deadlines[tape]
+                self.reschedule(tape)
+
+                # still due, the next update will play it
+                if self.deadlines.get(tape, self.stamp + 1) <= self.stamp:
+                    return self.deadlines[tape]
+            else:
+                return due
+
+        return None
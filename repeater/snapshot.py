@@ -0,0 +1,163 @@
+import os
+import mmap
+import queue
+import struct
+import threading
+from collections import namedtuple
+import tape
+from tape import TapeEvent
+
+MAGIC = b'PIMUSNP1'
+
+# magic, tape count, event count, unit period, lowq, highq, loop
+HEADER = struct.Struct('<8sIIdddB')
+# channel, note, period, cursor, events in this tape. all the tapes come
+# before all the events
+TAPE = struct.Struct('<BBddI')
+# status, data1, data2, ntime, index of the partner within its tape or -1
+EVENT = struct.Struct('<BBBdi')
+
+Key = namedtuple('Key', 'channel note')
+
+def snapshot(monolith):
+    '''
+    the little the engine thread has to do for a save: copies of the event
+    lists of every tape with anything on it, encoded later by encode
+    '''
+    tapes = []
+    for (channel, note), ks in monolith.keys.items():
+        tp = ks.tape
+        if tp.events:
+            tp.sync()
+            tapes.append((channel, note, tp.period, tp.npos, tuple(tp.events)))
+
+    return (monolith.unitp, monolith.lowq, monolith.highq, monolith.loop, tapes)
+
+def encode(snap):
+    unitp, lowq, highq, loop, tapes = snap
+    parts = [HEADER.pack(MAGIC, len(tapes), sum(len(t[4]) for t in tapes), unitp, lowq, highq, loop)]
+    pack_tape = TAPE.pack
+    pack_event = EVENT.pack
+
+    # every tape entry comes first, then all the events, so a restore can
+    # unpack the events in one pass
+    for channel, note, period, npos, events in tapes:
+        parts.append(pack_tape(channel, note, period, npos, len(events)))
+
+    for channel, note, period, npos, events in tapes:
+        position = {id(ev): i for i, ev in enumerate(events)}
+
+        # only pairs with both halves in the copy are kept, as the engine may
+        # have unpaired them since it was taken
+        partners = [-1]*len(events)
+        for i, ev in enumerate(events):
+            partner = ev.partner
+            if partner is not None and ev.is_on():
+                j = position.get(id(partner), -1)
+                if j >= 0:
+                    partners[i] = j
+                    partners[j] = i
+
+        for ev, partner in zip(events, partners):
+            parts.append(pack_event(ev.status, ev.data1, ev.data2, ev.ntime, partner))
+
+    return b''.join(parts)
+
+def write(path, data):
+    # a crash mid write leaves the previous snapshot in place
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+def restore(monolith, path):
+    '''
+    loads a snapshot into the repeater, replacing the tapes of the keys it has
+    loops for. returns the number of tapes restored. a file that is empty,
+    truncated or not a snapshot raises before anything is changed
+    '''
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf, memoryview(buf) as view:
+            magic, n_tapes, n_events, unitp, lowq, highq, loop = HEADER.unpack_from(buf, 0)
+            if magic != MAGIC:
+                raise ValueError("%s is not a tape snapshot" % (path))
+            start = HEADER.size + n_tapes*TAPE.size
+            if len(buf) < start + n_events*EVENT.size:
+                raise ValueError("%s is truncated" % (path))
+
+            entries = tuple(TAPE.iter_unpack(view[HEADER.size:start]))
+            rows = tuple(EVENT.iter_unpack(view[start:start + n_events*EVENT.size]))
+            if sum(entry[4] for entry in entries) != n_events:
+                raise ValueError("%s does not add up" % (path))
+
+            # pair the events up before anything changes, so a partner out of
+            # its tape is caught while the repeater is still as it was
+            atime = tape.now()
+            new = TapeEvent.restore
+            events = [new(status, data1, data2, ntime, atime) for status, data1, data2, ntime, partner in rows]
+
+            first = 0
+            for channel, note, period, npos, count in entries:
+                if channel > 15 or note > 127 or not 0 < period < float('inf'):
+                    raise ValueError("%s has a tape no key could play" % (path))
+                last = first + count
+                for i in range(first, last):
+                    partner = rows[i][4]
+                    if partner >= count:
+                        raise ValueError("%s pairs an event outside its tape" % (path))
+                    if partner >= 0:
+                        events[i].partner = events[first + partner]
+                first = last
+
+            monolith.loop = bool(loop)
+            monolith.lowq = lowq
+            monolith.highq = highq
+            monolith.unitp = unitp
+            monolith.reset_periods()
+
+            first = 0
+            for channel, note, period, npos, count in entries:
+                last = first + count
+                ks = monolith.getKeyState(Key(channel, note))
+                if period != ks.tape.period:
+                    ks.tape.set_period(period)
+                ks.tape.load(events[first:last], npos)
+                first = last
+
+            # what was restored is where undo stops, not an edit to undo
+            monolith.history.clear()
+    return n_tapes
+
+class SnapshotWriter:
+    '''
+    encodes and writes snapshots on a thread of its own, so saving never holds
+    up the engine loop for more than the copy of the event lists
+    '''
+    def __init__(self, path, maxsize=2):
+        self.path = path
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.saved = 0
+
+        self.writer = threading.Thread(target=self.drain, daemon=True)
+        self.writer.start()
+
+    def save(self, monolith):
+        try:
+            self.queue.put_nowait(snapshot(monolith))
+        except queue.Full:
+            self.dropped += 1
+
+    def drain(self):
+        while True:
+            snap = self.queue.get()
+            if snap is None: return
+            write(self.path, encode(snap))
+            self.saved += 1
+
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
@@ -1,13 +1,39 @@
 import time
+from bisect import bisect_left, bisect_right
+from math import floor
+import history
+
+# where tapes get the time from, swapped out to run them on a virtual clock
+now = time.time
 
 class TapeEvent:
+    # slots and the bare bytes keep each event small, a third of the size with
+    # its mido message, and leave the gc far less to walk in a long session.
+    # events are still tracked by it, the partners referring to each other
+    __slots__ = ('status', 'data1', 'data2', 'ntime', 'atime', 'partner')
+
     def __init__(self, message, tape):
-        self.atime = time.time()
-        self.ntime = (self.atime - tape.clip_start)/tape.period
+        self.atime = now()
+        # clip_start can be a cycle or more behind when no pass has wrapped
+        # the cursor since, the engine only waking for events and input
+        self.ntime = ((self.atime - tape.clip_start)/tape.period)%1.0
         self.partner = None
-        self.message = message
-        self.tape = tape
-        self.standdown = True
+        self.status, self.data1, self.data2 = message.bytes()
+
+    @classmethod
+    def restore(cls, status, data1, data2, ntime, atime):
+        # rebuild a saved event without a message to take it from
+        event = cls.__new__(cls)
+        event.status = status
+        event.data1 = data1
+        event.data2 = data2
+        event.ntime = ntime
+        event.atime = atime
+        event.partner = None
+        return event
+
+    def is_on(self):
+        return self.status & 0xF0 == 0x90
 
     def pair(self, partner):
         self.partner = partner
@@ -23,16 +49,20 @@ def between(a, b, c):
 class Tape:
     def __init__(self, keystate):
         self.events = []
+        self.ntimes = [] # parallel to events, kept sorted for bisection
+        self.version = 0 # counts changes to the contents
         self.index = 0
         self.npos = 0
         self.period = 10
-        self.clip_start = time.time()
+        self.clip_start = now()
+        self.resynced = None # when resync last put the cursor right, until the next update
         self.keystate = keystate
 
     def __repr__(self):
+        self.sync()
         canvas = ["-"]*100
         for ev in self.events:
-            if (ev.message.type == 'note_on'):
+            if ev.is_on():
                 canvas[floor(ev.ntime*100)] = '/'
             else:
                 canvas[floor(ev.ntime*100)] = '\\'
@@ -41,13 +71,38 @@ class Tape:
 
         return str(self.index) + ":" + "".join(canvas)
 
+    def sync(self):
+        # a vector engine keeps the cursors of the tapes it updates to itself,
+        # handing them back when they are needed
+        engine = self.keystate.parent.engine
+        if engine is not None:
+            engine.sync(self)
+
     def set_period(self, seconds):
         if(seconds != self.period):
-            atime = time.time()
+            self.sync()
+            atime = now()
             self.clip_start = atime - ((seconds*(atime-self.clip_start))/self.period)
             self.period = seconds
+            self.keystate.parent.schedule(self)
+
+    def resync(self):
+        #put the cursor where the clock says it should be, having not been updated
+        self.sync()
+        atime = now()
+        cycles = floor((atime - self.clip_start)/self.period)
+        self.clip_start = self.clip_start + cycles*self.period
+        self.npos = (atime - self.clip_start)/self.period
+        self.resynced = atime
+        self.keystate.parent.schedule(self)
 
     def update(self, dt):
+        if self.resynced is not None:
+            # the cursor is already right as of the resync, only the time since
+            # then is still to come, not the whole pass
+            dt = min(dt, now() - self.resynced)
+            self.resynced = None
+
         if (dt > self.period): return
 
         #calculate new cursor position
@@ -62,46 +117,76 @@ class Tape:
 
         if len(self.events) == 0: return# no events to trigger
 
-        self.index = (self.insertionPoint(self.npos)-1)%len(self.events)
+        # from the first event after the old cursor, those at it having been
+        # played by the last pass
+        self.index = self.insertionPoint(oldp)%len(self.events)
+        self.play_from(oldp)
+
+    def play_from(self, oldp):
+        # play, or erase when held, the events from index on that the cursor
+        # has passed since oldp
         next = self.events[self.index]
         ntime = next.ntime
 
+        if not between(oldp, ntime, self.npos): return
+
+        # each event once at most, events sharing an ntime would otherwise
+        # keep each other going round
+        left = len(self.events)
+
         #print("(oldp:%d, ntime:%d, newp:%d)", (oldp, ntime, self.npos))
-        while between(oldp, ntime, self.npos):
+        while left and between(oldp, ntime, self.npos):
+            left -= 1
             if self.keystate.held:
-                self.erase_event(next) # when active we are erasing
+                # when active we are erasing, which brings the next event to index
+                self.erase_event(next)
+                if len(self.events) == 0: return# no events to trigger
+                self.index = self.index%len(self.events)
             else:
                 self.playEvent(next)
+                self.index = (self.index + 1)%len(self.events)
 
-            if len(self.events) == 0: return# no events to trigger
-            self.index = (self.index + 1)%len(self.events)
             next = self.events[self.index]
             oldp = ntime
             ntime = next.ntime
 
-    def insertionPoint(self, ntime):
-        thumb = 0
-        next = self.events[thumb]
-
-        while next.ntime <= ntime: #find the index of the event after this one
-            thumb += 1
-            if thumb == len(self.events):
-                break
-            next = self.events[thumb]
+        self.keystate.parent.schedule(self)
 
-        return thumb
+    def insertionPoint(self, ntime):
+        #find the index of the event after this one
+        return bisect_right(self.ntimes, ntime)
+
+    def indexOf(self, event):
+        # only the run of events sharing this ntime needs scanning
+        i = bisect_left(self.ntimes, event.ntime)
+        while i < len(self.events) and self.ntimes[i] == event.ntime:
+            if self.events[i] is event:
+                return i
+            i += 1
+        return -1
+
+    def next_event(self, npos=None):
+        #the event that will be played next after the cursor, wrapping round
+        if len(self.events) == 0: return None
+        if npos is None:
+            self.sync()
+            npos = self.npos
+        return self.events[self.insertionPoint(npos)%len(self.events)]
 
     def playEvent(self, event):
-        self.keystate.on = event.message.type == 'note_on'
-        self.keystate.parent.output.send(event.message)
+        self.keystate.on = event.is_on()
+        self.keystate.parent.output.send_bytes(event.status, event.data1, event.data2)
+        self.keystate.parent.track(self.keystate)
 
 
     def cut(self):
         #if this time lies between on and off events it will destroy them
-        ntime = (time.time() - self.clip_start)/self.period
+        if len(self.events) == 0: return
+        self.sync()
+        ntime = ((now() - self.clip_start)/self.period)%1.0
         index = self.insertionPoint(ntime)%len(self.events)
         next_ev = self.events[index]
-        if next_ev.message.type == 'note_on':
+        if next_ev.is_on():
             self.erase_event(next_ev)
 
 
@@ -112,40 +197,87 @@ class Tape:
             self.insert_event(on_event)
             self.insert_event(off_event)
 
-    def insert_event(self, event):
+    def place(self, event):
+        # put the event in order without recording an edit
+        self.sync()
+        self.version += 1
         if len(self.events) == 0:
             self.events.append(event)
+            self.ntimes.append(event.ntime)
             self.index = 0
+            self.keystate.parent.track(self.keystate)
         else:
             thumb = self.insertionPoint(event.ntime)
 
             #insering there inserts before
             self.events.insert(thumb, event)
+            self.ntimes.insert(thumb, event.ntime)
 
             # if installed before current scanner head index it is shifted otherwise not
             if thumb < self.index:
                 self.index = self.index + 1
 
+        self.keystate.parent.schedule(self)
+
+    def remove(self, event):
+        # take out just this event without recording an edit
+        index = self.indexOf(event)
+        if index < 0: return False
+        self.sync()
+        self.version += 1
+
+        self.events.pop(index)
+        self.ntimes.pop(index)
+
+        #shift current position back
+        if (index < self.index):
+            self.index = self.index - 1
+
+        self.keystate.parent.schedule(self)
+        if len(self.events) == 0:
+            self.keystate.parent.track(self.keystate)
+        return True
+
+    def replace(self, events, ntimes):
+        # swap in other contents wholesale, the lists are taken not copied
+        self.sync()
+        self.version += 1
+        self.events = events
+        self.ntimes = ntimes
+        self.index = (self.insertionPoint(self.npos) - 1)%len(events) if events else 0
+        self.keystate.parent.schedule(self)
+        self.keystate.parent.track(self.keystate)
+
+    def insert_event(self, event):
+        self.place(event)
+        self.keystate.parent.history.record(self, history.INSERT, event)
+
     def events_between(self, event1, event2):
         return filter(lambda ev: between(event1.ntime, ev.ntime, event2.ntime), self.events)
 
     def erase_event(self, event):
-        try:
-            index = self.events.index(event)
-            self.events.pop(index)
-
-            #shift current position back
-            if (index < self.index):
-                self.index = self.index - 1
-        except ValueError:
-            pass
+        partner = event.partner
+        if self.remove(event):
+            self.keystate.parent.history.record(self, history.ERASE, event, partner)
 
         #remove corresponding on/off message
-        if not event.partner is None:
-            partner = event.partner
+        if not partner is None:
             event.unpair()
             self.erase_event(partner)
 
+    def load(self, events, npos):
+        # replace the contents with events already in ntime order, the cursor
+        # at npos as of now, without recording an edit
+        self.sync()
+        self.npos = npos
+        self.clip_start = now() - npos*self.period
+        self.replace(events, [ev.ntime for ev in events])
+
     def clear(self):
-        self.events = []
-        self.index = 0
+        self.swap([], [])
+
+    def swap(self, events, ntimes):
+        # the old lists go into the history untouched, so this stays O(1)
+        if self.events or events:
+            self.keystate.parent.history.record(self, history.REPLACE, (self.events, self.ntimes), (events, ntimes))
+        self.replace(events, ntimes)
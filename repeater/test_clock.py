@@ -0,0 +1,59 @@
+#! /usr/bin/python3
+# tempo from synthetic midi clock ticks: how often a change is published and
+# where the estimate settles
+#   cd repeater && python3 -m unittest test_clock
+import random
+import unittest
+import clock
+
+def play(c, bpm, beats, start=1000.0, jitter=0, drop=0, duplicate=0, seed=1):
+    # returns when the tick after the last came and the bpm of every publish
+    rnd = random.Random(seed)
+    interval = 60.0/bpm/24
+    published = []
+    for k in range(24*beats):
+        if rnd.random() < drop: continue
+        t = start + k*interval + rnd.gauss(0, jitter)
+        c.tick(t)
+        if rnd.random() < duplicate:
+            c.tick(t + 0.0005)
+
+        if c.changed:
+            c.changed = False
+            published.append((t, c.bpm))
+    return start + 24*beats*interval, published
+
+class ClockTest(unittest.TestCase):
+    def test_steady_clock_publishes_once(self):
+        c = clock.Clock()
+        end, published = play(c, 120, 200)
+        self.assertEqual(len(published), 1)
+        self.assertAlmostEqual(c.bpm, 120, places=6)
+
+    def test_jitter_does_not_churn(self):
+        for jitter in (0.001, 0.0025, 0.003):
+            c = clock.Clock()
+            end, published = play(c, 120, 200, jitter=jitter)
+            self.assertLessEqual(len(published), 10, jitter)
+            self.assertAlmostEqual(c.bpm, 120, delta=0.5)
+
+    def test_dropped_and_duplicated_ticks_do_not_bias(self):
+        c = clock.Clock()
+        end, published = play(c, 120, 200, jitter=0.002, drop=0.02, duplicate=0.02)
+        self.assertGreater(c.dropped, 0)
+        self.assertGreater(c.duplicated, 0)
+        self.assertLessEqual(len(published), 20)
+        self.assertAlmostEqual(c.bpm, 120, delta=0.5)
+
+    def test_tempo_change_is_published_promptly(self):
+        c = clock.Clock()
+        t, published = play(c, 120, 20)
+        for bpm in (140, 90):
+            change = t
+            t, published = play(c, bpm, 20, start=t)
+            self.assertTrue(published, bpm)
+            self.assertLess(published[0][0] - change, 1.0)
+            self.assertAlmostEqual(published[-1][1], bpm, places=3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#! /usr/bin/python3
+# undo and redo of notes laid on the tapes, a press at a time
+#   cd repeater && python3 -m unittest test_history
+import time
+import unittest
+import mido
+import tape
+import repeater
+from history import History
+from bench_repeater import VirtualClock, FakePort
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        tape.now = self.clock.now
+        self.monolith = repeater.Repeater(FakePort(self.clock))
+        self.monolith.set_unit_period(2.0)
+        self.monolith.loopOn()
+
+    def tearDown(self):
+        tape.now = time.time
+
+    def play(self, note, length=0.1):
+        self.monolith.noteOn(mido.Message('note_on', note=note, velocity=100))
+        self.clock.advance(length)
+        self.monolith.noteOff(mido.Message('note_off', note=note))
+        self.clock.advance(0.05)
+
+    def events(self, note):
+        ks = self.monolith.keys.get((0, note))
+        return [] if ks is None else list(ks.tape.events)
+
+    def test_each_press_is_one_step(self):
+        self.play(60)
+        self.play(62)
+        first, second = self.events(60), self.events(62)
+        self.assertEqual((len(first), len(second)), (2, 2))
+
+        self.monolith.undo()
+        self.assertEqual((self.events(60), self.events(62)), (first, []))
+        self.monolith.undo()
+        self.assertEqual((self.events(60), self.events(62)), ([], []))
+
+        self.monolith.redo()
+        self.assertEqual((self.events(60), self.events(62)), (first, []))
+        self.monolith.redo()
+        self.assertEqual((self.events(60), self.events(62)), (first, second))
+        self.assertIs(second[0].partner, second[1])
+
+    def test_new_press_forgets_what_was_undone(self):
+        self.play(60)
+        self.play(62)
+        self.monolith.undo()
+        self.play(64)
+
+        self.monolith.redo()
+        self.assertEqual(self.events(62), [])
+        self.assertEqual(len(self.events(64)), 2)
+
+    def test_clearing_every_tape_is_one_step(self):
+        self.play(60)
+        self.play(62)
+        before = (self.events(60), self.events(62))
+
+        self.monolith.clearAllTapes()
+        self.assertEqual((self.events(60), self.events(62)), ([], []))
+        self.monolith.undo()
+        self.assertEqual((self.events(60), self.events(62)), before)
+        self.monolith.redo()
+        self.assertEqual((self.events(60), self.events(62)), ([], []))
+
+    def test_undoing_an_erase_pairs_the_events_again(self):
+        self.play(60)
+        on, off = self.events(60)
+        tp = self.monolith.keys[(0, 60)].tape
+
+        self.monolith.history.mark()
+        tp.erase_event(on)
+        self.assertEqual(tp.events, [])
+        self.assertIsNone(on.partner)
+
+        self.monolith.undo()
+        self.assertEqual(tp.events, [on, off])
+        self.assertEqual(tp.ntimes, [on.ntime, off.ntime])
+        self.assertIs(on.partner, off)
+
+    def test_only_depth_steps_are_kept(self):
+        self.monolith.history = History(depth=2)
+        for note in (60, 62, 64):
+            self.play(note)
+
+        for i in range(3):
+            self.monolith.undo()
+        self.assertEqual(len(self.events(60)), 2)
+        self.assertEqual((self.events(62), self.events(64)), ([], []))
+
+if __name__ == '__main__':
+    unittest.main()
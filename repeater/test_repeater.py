@@ -0,0 +1,77 @@
+#! /usr/bin/python3
+# loops recorded and played back on a virtual clock, with the engine only
+# woken for input and due events as main_loop does
+#   cd repeater && python3 -m unittest test_repeater
+import time
+import unittest
+import mido
+import tape
+import repeater
+import scheduler
+import vector_engine
+from bench_repeater import VirtualClock, FakePort
+
+ON = mido.Message('note_on', note=60, velocity=100)
+OFF = mido.Message('note_off', note=60)
+
+class Session:
+    def __init__(self, vector=False):
+        self.clock = VirtualClock()
+        tape.now = self.clock.now
+        self.port = FakePort(self.clock)
+        self.sched = scheduler.Scheduler()
+        self.sched.advance(self.clock.t)
+        self.monolith = repeater.Repeater(self.port, self.sched)
+        if vector:
+            vector_engine.VectorEngine(self.monolith)
+        self.monolith.set_unit_period(1.0)
+        self.last = self.clock.t
+
+    def at(self, t, *messages):
+        # one pass of the engine loop: dispatch, then update for the time since
+        # the last pass
+        self.clock.t = t
+        for message in messages:
+            if message.type == 'note_on':
+                self.monolith.noteOn(message)
+            else:
+                self.monolith.noteOff(message)
+        self.sched.advance(t)
+        self.monolith.update(t - self.last)
+        self.last = t
+
+    def run_until(self, end):
+        while True:
+            due = self.sched.next_due()
+            if due is None or due > end: return
+            self.at(due)
+
+    def sent(self, since=0):
+        return [(round(t, 6), data[0]) for t, data in self.port._rt.sent[since:]]
+
+class ResyncTest(unittest.TestCase):
+    def tearDown(self):
+        tape.now = time.time
+
+    def replay_after_idle(self, vector):
+        s = Session(vector)
+        # the key is used once, then sits idle out of the active set
+        s.at(1000.0, ON)
+        s.at(1000.1, OFF)
+        s.monolith.loopOn()
+
+        s.at(1000.85, ON)
+        s.at(1001.35, OFF)
+        recorded = len(s.port._rt.sent)
+        s.run_until(1002.5)
+        return s.sent(recorded)
+
+    def test_rejoining_key_keeps_time(self):
+        self.assertEqual(self.replay_after_idle(False), [(1001.85, 0x90), (1002.35, 0x80)])
+
+    @unittest.skipIf(vector_engine.numpy is None, "the vector engine needs numpy")
+    def test_rejoining_key_keeps_time_vector(self):
+        self.assertEqual(self.replay_after_idle(True), [(1001.85, 0x90), (1002.35, 0x80)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#! /usr/bin/python3
+# messages through the shared memory rings, sysex spread over slots and
+# wrapping round the end of the block
+#   cd repeater && python3 -m unittest test_ring
+import unittest
+import mido
+import ring
+
+def sysex(length):
+    return bytes([0xF0] + [i%128 for i in range(length - 2)] + [0xF7])
+
+class RingTest(unittest.TestCase):
+    def setUp(self):
+        self.ring = ring.Ring(slots=8)
+
+    def tearDown(self):
+        self.ring.close()
+        self.ring.unlink()
+
+    def test_short_messages_keep_their_order(self):
+        self.assertTrue(self.ring.push(1, 0.5, bytes((0x90, 60, 100))))
+        self.assertFalse(self.ring.push(2, 0.75, bytes((0xC0, 5))))
+        self.assertEqual(self.ring.pop(), [(1, 0.5, bytes((0x90, 60, 100))), (2, 0.75, bytes((0xC0, 5)))])
+        self.assertEqual(self.ring.pop(), ())
+
+    def test_sysex_comes_back_whole(self):
+        for length in (4, 19, 20, 40, 8*ring.SLOT.size - 13):
+            data = sysex(length)
+            self.assertTrue(self.ring.push(0, 1.0, data))
+            self.assertEqual(self.ring.pop(), [(0, 1.0, data)], length)
+
+    def test_sysex_wraps_round_the_end(self):
+        # move the head to just short of the end first
+        for i in range(6):
+            self.ring.push(0, 0, bytes((0x90, i, 1)))
+        self.ring.pop()
+
+        data = sysex(40)
+        self.ring.push(0, 2.0, data)
+        self.ring.push(0, 3.0, bytes((0x80, 60, 0)))
+        self.assertEqual(self.ring.pop(), [(0, 2.0, data), (0, 3.0, bytes((0x80, 60, 0)))])
+
+    def test_no_room_drops_whole_messages(self):
+        for i in range(7):
+            self.ring.push(0, 0, bytes((0x90, i, 1)))
+        self.assertFalse(self.ring.push(0, 0, sysex(40)))
+        self.ring.push(0, 0, bytes((0x90, 7, 1)))
+        self.assertFalse(self.ring.push(0, 0, bytes((0x90, 8, 1))))
+
+        self.assertEqual(self.ring.dropped, 2)
+        self.assertEqual([data[1] for source, t, data in self.ring.pop()], list(range(8)))
+
+class RingFeedTest(unittest.TestCase):
+    def test_messages_come_back_from_their_source(self):
+        feed = ring.RingFeed(('keys', 'pads'))
+        try:
+            feed.callback('pads')(mido.Message('sysex', data=range(30)))
+            feed.callback('keys')(mido.Message('note_on', note=60, velocity=90))
+
+            received = [(source, message) for source, t, message in feed.receive(0)]
+            self.assertEqual(received, [('keys', mido.Message('note_on', note=60, velocity=90)),
+                ('pads', mido.Message('sysex', data=range(30)))])
+        finally:
+            feed.close()
+
+if __name__ == '__main__':
+    unittest.main()
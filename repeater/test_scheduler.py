@@ -0,0 +1,70 @@
+#! /usr/bin/python3
+# when the scheduler says each tape next needs the engine, and how it keeps
+# that straight as tapes change
+#   cd repeater && python3 -m unittest test_scheduler
+import unittest
+from bisect import bisect_right
+from types import SimpleNamespace
+import scheduler
+
+class Loop:
+    # just what the scheduler asks of a tape
+    def __init__(self, ntimes, npos=0.0, period=1.0):
+        self.ntimes = sorted(ntimes)
+        self.npos = npos
+        self.period = period
+
+    def next_event(self):
+        if not self.ntimes: return None
+        return SimpleNamespace(ntime=self.ntimes[bisect_right(self.ntimes, self.npos)%len(self.ntimes)])
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.sched = scheduler.Scheduler()
+        self.sched.advance(100.0)
+
+    def test_due_when_the_next_event_comes_round(self):
+        ahead = Loop([0.25, 0.75], npos=0.5, period=2.0)
+        behind = Loop([0.25], npos=0.5, period=2.0)
+        at_cursor = Loop([0.5], npos=0.5, period=2.0)
+
+        self.assertEqual(self.sched.due_time(ahead), 100.5)
+        self.assertEqual(self.sched.due_time(behind), 101.5)
+        # one at the cursor was played by the pass that got there
+        self.assertEqual(self.sched.due_time(at_cursor), 102.0)
+        self.assertIsNone(self.sched.due_time(Loop([])))
+
+    def test_earliest_of_all_the_tapes(self):
+        loops = [Loop([0.9], period=1.0), Loop([0.5], period=4.0), Loop([0.3], period=1.0)]
+        for loop in loops:
+            self.sched.reschedule(loop)
+        self.assertAlmostEqual(self.sched.next_due(), 100.3)
+
+    def test_rescheduled_and_emptied_tapes_leave_no_stale_deadline(self):
+        early = Loop([0.1])
+        late = Loop([0.6])
+        self.sched.reschedule(early)
+        self.sched.reschedule(late)
+
+        early.ntimes = [0.8]
+        self.sched.reschedule(early)
+        self.assertAlmostEqual(self.sched.next_due(), 100.6)
+
+        late.ntimes = []
+        self.sched.reschedule(late)
+        self.assertAlmostEqual(self.sched.next_due(), 100.8)
+
+        early.ntimes = []
+        self.sched.reschedule(early)
+        self.assertIsNone(self.sched.next_due())
+
+    def test_missed_deadline_comes_round_again(self):
+        loop = Loop([0.2])
+        self.sched.reschedule(loop)
+
+        # the engine slept through it without moving the cursor
+        self.sched.advance(100.5)
+        self.assertAlmostEqual(self.sched.next_due(), 100.7)
+
+if __name__ == '__main__':
+    unittest.main()
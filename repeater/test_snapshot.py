@@ -0,0 +1,95 @@
+#! /usr/bin/python3
+# saving the tapes and loading them back, and what a bad file leaves behind
+#   cd repeater && python3 -m unittest test_snapshot
+import os
+import time
+import struct
+import tempfile
+import unittest
+import mido
+import tape
+import repeater
+import snapshot
+from tape import TapeEvent
+from bench_repeater import VirtualClock, FakePort
+
+def session():
+    clock = VirtualClock()
+    tape.now = clock.now
+    monolith = repeater.Repeater(FakePort(clock))
+    monolith.set_unit_period(2.0)
+    monolith.loopOn()
+    return monolith
+
+def lay_loops(monolith, notes):
+    for note in notes:
+        ks = monolith.getKeyState(mido.Message('note_on', note=note))
+        events = []
+        for j in range(4):
+            on = TapeEvent.restore(0x90, note, 100, j/4, 0)
+            off = TapeEvent.restore(0x80, note, 0, (j + 0.5)/4, 0)
+            on.pair(off)
+            events.extend((on, off))
+        ks.tape.load(events, 0.25)
+
+def contents(monolith):
+    return sorted((key, tuple((ev.status, ev.data1, ev.data2, ev.ntime, ev.partner.ntime if ev.partner else None)
+        for ev in ks.tape.events), ks.tape.npos) for key, ks in monolith.keys.items() if ks.tape.events)
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'tapes.snap')
+
+    def tearDown(self):
+        tape.now = time.time
+        self.dir.cleanup()
+
+    def save(self, monolith):
+        snapshot.write(self.path, snapshot.encode(snapshot.snapshot(monolith)))
+
+    def test_round_trip(self):
+        saved = session()
+        lay_loops(saved, (48, 60, 72))
+        self.save(saved)
+
+        restored = session()
+        self.assertEqual(snapshot.restore(restored, self.path), 3)
+        self.assertEqual(contents(restored), contents(saved))
+        self.assertEqual(restored.unitp, saved.unitp)
+
+    def test_undo_after_restore_keeps_the_loops(self):
+        saved = session()
+        lay_loops(saved, (48, 60, 72))
+        self.save(saved)
+
+        restored = session()
+        snapshot.restore(restored, self.path)
+        restored.undo()
+        self.assertEqual(contents(restored), contents(saved))
+
+    def test_bad_files_change_nothing(self):
+        saved = session()
+        lay_loops(saved, (60,))
+        self.save(saved)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        # the partner of the first event pointed past the end of its tape
+        at = snapshot.HEADER.size + snapshot.TAPE.size + 3 + 8
+        bad_partner = data[:at] + struct.pack('<i', 99) + data[at + 4:]
+
+        for blob in (b'', data[:10], data[:-3], bad_partner):
+            with open(self.path, 'wb') as f:
+                f.write(blob)
+
+            monolith = session()
+            lay_loops(monolith, (50,))
+            before = contents(monolith)
+            with self.assertRaises((ValueError, struct.error)):
+                snapshot.restore(monolith, self.path)
+            self.assertEqual(contents(monolith), before)
+            self.assertEqual(monolith.unitp, 2.0)
+
+if __name__ == '__main__':
+    unittest.main()
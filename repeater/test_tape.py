@@ -0,0 +1,83 @@
+#! /usr/bin/python3
+# the bisected ntime index of a tape against scanning it with between, the
+# cursor wrapping round the end of the loop
+#   cd repeater && python3 -m unittest test_tape
+import time
+import random
+import unittest
+import mido
+import tape
+import repeater
+from tape import TapeEvent, between
+from bench_repeater import VirtualClock, FakePort
+
+def loaded(ntimes, npos=0.0):
+    # a tape holding an event at each ntime, its velocity saying which
+    clock = VirtualClock()
+    tape.now = clock.now
+    monolith = repeater.Repeater(FakePort(clock))
+    ks = monolith.getKeyState(mido.Message('note_on', note=60))
+    events = [TapeEvent.restore(0x90, 60, i + 1, ntime, 0) for i, ntime in enumerate(sorted(ntimes))]
+    ks.tape.load(events, npos)
+    # the key resynced as it was made, the clock standing still meanwhile,
+    # which would hold back the first update
+    ks.tape.resynced = None
+    return ks.tape, monolith.output._rt.sent
+
+class TapeTest(unittest.TestCase):
+    def tearDown(self):
+        tape.now = time.time
+
+    def test_index_stays_sorted_and_parallel(self):
+        rnd = random.Random(3)
+        tp, sent = loaded([])
+        for i in range(200):
+            if tp.events and rnd.random() < 0.3:
+                self.assertTrue(tp.remove(rnd.choice(tp.events)))
+            else:
+                # a few shared ntimes, which indexOf has to tell apart
+                tp.place(TapeEvent.restore(0x90, 60, 1, rnd.choice((0.25, 0.5, rnd.random())), 0))
+
+            self.assertEqual(tp.ntimes, [ev.ntime for ev in tp.events])
+            self.assertEqual(tp.ntimes, sorted(tp.ntimes))
+        for i, ev in enumerate(tp.events):
+            self.assertIs(tp.events[tp.indexOf(ev)], ev)
+
+    def test_next_event_wraps_round(self):
+        tp, sent = loaded([0.2, 0.5, 0.8])
+        self.assertEqual(tp.next_event(0.1).ntime, 0.2)
+        self.assertEqual(tp.next_event(0.5).ntime, 0.8)
+        self.assertEqual(tp.next_event(0.9).ntime, 0.2)
+
+    def test_update_plays_what_between_says(self):
+        rnd = random.Random(7)
+        ntimes = [rnd.random() for i in range(40)]
+        tp, sent = loaded(ntimes, npos=rnd.random())
+        tp.period = 1.0
+
+        for step in range(300):
+            oldp = tp.npos
+            dt = rnd.choice((0.01, 0.1, 0.3, 0.7))
+            start = len(sent)
+            tp.update(dt)
+
+            # every event the cursor passed, those after the end of the loop
+            # coming round again from the start
+            passed = sorted((ev for ev in tp.events if between(oldp, ev.ntime, tp.npos)),
+                key=lambda ev: (ev.ntime - oldp)%1.0)
+            self.assertEqual([data[2] for t, data in sent[start:]], [ev.data2 for ev in passed], step)
+
+    def test_held_key_erases_everything_passed(self):
+        tp, sent = loaded([0.1, 0.2, 0.3, 0.4, 0.6, 0.7], npos=0.05)
+        tp.period = 1.0
+        for on, off in ((0, 1), (2, 3), (4, 5)):
+            tp.events[on].pair(tp.events[off])
+        left = tp.events[4:]
+
+        tp.keystate.held = True
+        tp.update(0.5)
+        self.assertEqual(tp.events, left)
+        self.assertEqual(sent, [])
+
+if __name__ == '__main__':
+    unittest.main()
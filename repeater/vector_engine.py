@@ -0,0 +1,190 @@
+import tape
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class VectorEngine:
+    '''
+    updates every active tape of a repeater in one batched pass. the cursors
+    and periods of the tapes are kept in vectors and the ntimes of all their
+    events in one array, so moving the cursors and finding which tapes have
+    an event due is done for all of them at once. only the tapes with
+    something due go on to play it through Tape.play_from, in the order the
+    per tape update would have visited them, which keeps what comes out
+    identical to it.
+
+    the cursors live in the vectors between updates, only the tapes that fire
+    get theirs written back. any other tape is brought up to date by sync when
+    something reads or changes its cursor
+    '''
+    def __init__(self, monolith):
+        if numpy is None:
+            raise ImportError("the vector engine needs numpy")
+
+        self.monolith = monolith
+        self.tapes = None # one per slot, in the order of the active set
+        self.dirty = set()
+        self.arrays = {} # tape to (version, its ntimes as an array)
+        self.firing = False
+        self.slot = {}
+        self.fresh = [] # slots of tapes resynced since the last pass
+        monolith.engine = self
+
+    def regroup(self):
+        # the active set changed, so the slots are laid out again, once the
+        # tapes leaving them have their cursors back
+        if self.tapes is not None:
+            for i in numpy.flatnonzero(self.stale).tolist():
+                self.write_back(i)
+        self.tapes = None
+        self.slot = {}
+
+    def sync(self, tape):
+        i = self.slot.get(tape)
+        if i is not None and self.stale[i]:
+            self.write_back(i)
+
+    def write_back(self, i):
+        tp = self.tapes[i]
+        tp.npos = self.npos[i].item()
+        tp.clip_start = self.clip_start[i].item()
+        tp.index = self.index[i].item()
+        self.stale[i] = False
+
+    def touch(self, tape):
+        # tapes playing their events leave their cursors as they were set
+        if not self.firing:
+            self.dirty.add(tape)
+
+    def layout(self):
+        tapes = self.tapes = [ks.tape for ks in tuple(self.monolith.active)]
+        self.slot = {tp: i for i, tp in enumerate(tapes)}
+        self.dirty.clear()
+
+        self.period = numpy.array([tp.period for tp in tapes], dtype=numpy.float64)
+        self.npos = numpy.array([tp.npos for tp in tapes], dtype=numpy.float64)
+        self.clip_start = numpy.array([tp.clip_start for tp in tapes], dtype=numpy.float64)
+        self.index = numpy.array([tp.index for tp in tapes], dtype=numpy.int64)
+        self.stale = numpy.zeros(len(tapes), dtype=bool)
+        self.fresh = [i for i, tp in enumerate(tapes) if tp.resynced is not None]
+        self.pack()
+
+    def pack(self):
+        # the events of every tape end to end, with where each one starts
+        tapes = self.tapes
+        self.versions = [tp.version for tp in tapes]
+        self.count = numpy.array([len(tp.ntimes) for tp in tapes], dtype=numpy.int64)
+        self.offset = numpy.zeros(len(tapes), dtype=numpy.int64)
+        numpy.cumsum(self.count[:-1], out=self.offset[1:])
+
+        self.key = numpy.repeat(numpy.arange(len(tapes)), self.count)
+
+        # only the tapes that changed since they were last packed are copied
+        arrays = {}
+        for tp in tapes:
+            cached = self.arrays.get(tp)
+            if cached is None or cached[0] != tp.version:
+                cached = (tp.version, numpy.array(tp.ntimes, dtype=numpy.float64))
+            arrays[tp] = cached
+        self.arrays = arrays
+        self.ntimes = numpy.concatenate([arrays[tp][1] for tp in tapes]) if tapes else numpy.zeros(0)
+
+    def refresh(self):
+        # take up changes made to tapes outside of update, which synced them
+        # before making them
+        repack = False
+        for tp in self.dirty:
+            i = self.slot.get(tp)
+            if i is None: continue
+
+            self.period[i] = tp.period
+            self.npos[i] = tp.npos
+            self.clip_start[i] = tp.clip_start
+            self.index[i] = tp.index
+            if tp.resynced is not None:
+                self.fresh.append(i)
+            if tp.version != self.versions[i]:
+                repack = True
+
+        self.dirty.clear()
+        if repack:
+            self.pack()
+
+    def update(self, dt):
+        if self.tapes is None:
+            self.layout()
+        elif self.dirty:
+            self.refresh()
+
+        tapes = self.tapes
+        if not tapes: return
+
+        # tapes resynced since the last pass only move on from the resync,
+        # as in Tape.update
+        if self.fresh:
+            atime = tape.now()
+            dt = numpy.full(len(tapes), dt)
+            for i in self.fresh:
+                tp = tapes[i]
+                if tp.resynced is not None:
+                    dt[i] = min(dt[i], atime - tp.resynced)
+                    tp.resynced = None
+            self.fresh = []
+
+        # the same cursor maths as Tape.update, tapes with a period shorter
+        # than dt being left where they are
+        moved = dt <= self.period
+        oldp = self.npos
+        newp = oldp + dt/self.period
+        wrapped = moved & (newp > 1)
+
+        npos = numpy.where(wrapped, newp - 1, numpy.where(moved, newp, oldp))
+        clip_start = numpy.where(wrapped, self.clip_start + self.period, self.clip_start)
+
+        # the first event after the old cursor, wrapping round to the start,
+        # found as the count of each tape's ntimes not after it
+        count = self.count
+        occupied = count > 0
+        passed = numpy.bincount(self.key, weights=self.ntimes <= oldp[self.key], minlength=len(tapes)).astype(numpy.int64)
+        index = numpy.zeros(len(tapes), dtype=numpy.int64)
+        index[occupied] = passed[occupied]%count[occupied]
+        ntime = numpy.zeros(len(tapes))
+        ntime[occupied] = self.ntimes[self.offset[occupied] + index[occupied]]
+
+        # between(oldp, ntime, npos) for every tape at once
+        has_events = moved & occupied
+        due = has_events & (((oldp <= ntime) & (ntime <= npos)) |
+            ((npos < oldp) & (((0 <= ntime) & (ntime <= npos)) | ((oldp <= ntime) & (ntime <= 1)))))
+
+        self.npos = npos
+        self.clip_start = clip_start
+        self.index = numpy.where(has_events, index, self.index)
+        self.stale |= moved
+
+        fired = numpy.flatnonzero(due).tolist()
+        if not fired: return
+
+        # the tapes firing get their cursors back first, as playing an event
+        # can regroup the slots
+        for i, p, c, x in zip(fired, npos[fired].tolist(), clip_start[fired].tolist(), self.index[fired].tolist()):
+            tp = tapes[i]
+            tp.npos = p
+            tp.clip_start = c
+            tp.index = x
+        self.stale[fired] = False
+
+        olds = oldp.tolist()
+        self.firing = True
+        for i in fired:
+            tapes[i].play_from(olds[i])
+        self.firing = False
+
+        if self.tapes is not tapes: return
+        self.index[fired] = [tapes[i].index for i in fired]
+
+        # a held key erases what it passes
+        versions = self.versions
+        if any(tapes[i].version != versions[i] for i in fired):
+            self.pack()
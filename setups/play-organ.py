@@ -1,7 +1,14 @@
 import signal
 import sys
 import mod_host
+from mod_host.rig import Rig
 import time
+
+ORGAN = Rig(
+    bundles=["/home/pi/lv2plugins/faust.lv2"],
+    plugins={'organ': ('organ', {})}
+)
+
 if __name__ == '__main__':
     c = mod_host.Client(5000)
 
@@ -12,8 +19,8 @@ if __name__ == '__main__':
     signal.signal(signal.SIGINT, signal_handler)
 
     try:
-        c.add_bundle("/home/pi/lv2plugins/faust.lv2")
-        c.add_plugin('organ')
+        report = ORGAN.apply(c)
+        print("rig applied in %.3fs" % (report['seconds']))
         time.sleep(5) 
         signal.pause()
     except Exception as e: